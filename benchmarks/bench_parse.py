@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# Compares the HCL tokenizer in hab.hcl against the line regexes it replaced.
+#
+#   python benchmarks/bench_parse.py [--blocks N] [--repeat N]
+#
+# Run from the repository root so hab is importable.
+
+import argparse
+import logging
+import re
+import sys
+import time
+from pathlib import PosixPath
+
+sys.path.insert(0, str(PosixPath(__file__).resolve().parent.parent))
+
+from hab.parse import parse_tf_input, parse_tf_output, parse_tf_variable_names
+
+# The regexes hab used before the tokenizer, kept here as the baseline
+LEGACY_INPUT = re.compile(r'^variable\s+"(?P<name>\w+)"\s+{\n(?P<conf>(?:[\t ]*\w+[\t ]*=[\t ]*[\S\t ]+\n)+)^}', flags=re.MULTILINE)
+LEGACY_OUTPUT = re.compile(r'^output\s+"(?P<name>\w+)"\s+{\n(?P<conf>(?:[\t ]*\w+[\t ]*=[\t ]*[\S\t ]+\n)+)^}', flags=re.MULTILINE)
+
+SIMPLE_VARIABLE = '''variable "simple_{i}" {{
+  type        = string
+  description = "Variable {i}"
+  default     = "x"
+}}
+'''
+
+COMPLEX_VARIABLE = '''variable "complex_{i}" {{
+  description = <<-EOT
+    A variable with {{ braces }} in its description
+  EOT
+  type = object({{
+    name  = string
+    ports = list(number)
+  }})
+  default = {{ name = "n{i}", ports = [80, 443] }}
+  validation {{
+    condition     = length(var.complex_{i}.name) > 0
+    error_message = "Must not be empty."
+  }}
+}}
+'''
+
+OUTPUT = '''output "out_{i}" {{
+  value     = aws_instance.i{i}.id
+  sensitive = {sensitive}
+}}
+'''
+
+RESOURCE = '''resource "aws_instance" "i{i}" {{
+  ami  = "ami-{i}"
+  tags = {{
+    Name = "${{var.simple_{i}}}-x"
+  }}
+{attrs}  lifecycle {{
+    ignore_changes = [tags]
+  }}
+}}
+'''
+
+def generate(blocks):
+    parts = []
+    for i in range(blocks):
+        parts.append(SIMPLE_VARIABLE.format(i=i))
+        parts.append(COMPLEX_VARIABLE.format(i=i))
+        parts.append(OUTPUT.format(i=i, sensitive='true' if i % 2 else 'false'))
+        attrs = ''.join(f'  attr{j} = "value {j} ${{local.x}}"\n' for j in range(20))
+        parts.append(RESOURCE.format(i=i, attrs=attrs))
+    return ''.join(parts)
+
+def legacy(text):
+    inputs = [ m.group('name') for m in LEGACY_INPUT.finditer(text) ]
+    outputs = [ m.group('name') for m in LEGACY_OUTPUT.finditer(text) ]
+    return inputs, outputs
+
+def names(text):
+    return parse_tf_variable_names(text)
+
+def full(text):
+    inputs = [ v.name for v in parse_tf_input(text) ]
+    outputs = [ v.name for v in parse_tf_output(text) ]
+    return inputs, outputs
+
+def timed(func, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark .tf variable parsing')
+    parser.add_argument('--blocks', type=int, default=500, help='Number of each kind of block to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per parser, the best is reported')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    text = generate(args.blocks)
+    print(f'{len(text) // 1024} KiB, {args.blocks} of each block')
+    expected = args.blocks * 2, args.blocks
+    results = {}
+    for func in (legacy, names, full):
+        duration, (inputs, outputs) = timed(func, text, args.repeat)
+        results[func.__name__] = duration, len(inputs) + len(outputs)
+        print(f'{func.__name__:>8}: {duration * 1000:8.2f}ms  found {len(inputs)}/{expected[0]} variables, {len(outputs)}/{expected[1]} outputs')
+    # The regexes miss any block they can't follow, the tokenizer pays for reading every one of them
+    for name in ('names', 'full'):
+        duration, found = results[name]
+        print(f'{name:>8}: {duration / results["legacy"][0]:.1f}x the time of legacy, finds {found - results["legacy"][1]} more of {sum(expected)}')
+
+if __name__ == '__main__':
+    main()
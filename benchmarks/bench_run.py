@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# Benchmarks hab end to end against a synthetic project (see synth.py) and a
+# stand-in terraform (see fake_terraform.py), so it runs offline in seconds.
+#
+#   python benchmarks/bench_run.py [--modules N] [--width N] [--fan-in N] [--variables N]
+#                                  [--waiters N] [--jobs N] [--durations SPEC] [--check]
+#
+# Measures:
+#   import       starting the interpreter and importing hab.cli
+#   load         loading the habfile and modules and building the schedule, cold and warm
+#   graph        building the dependency graph and schedule alone
+#   apply        wall time of a full apply, and how close it gets to the best
+#                possible time for the simulated durations and number of jobs
+#   incremental  wall time of a second apply with nothing left to change
+#
+# With --check the exit status is 1 when any result crosses its threshold.
+# Run from the repository root so hab is importable.
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import PosixPath
+
+REPO = PosixPath(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(REPO / 'benchmarks'))
+
+from synth import BIOME, generate
+from hab.biome import Biome
+from hab.env import Environment
+from hab.stage import build_schedule
+
+# Phases apply runs for every module, as simulated by the fake terraform
+_APPLY_PHASES = [ 'init', 'validate', 'plan', 'apply' ]
+_DEFAULT_DURATIONS = 'init=0.05,validate=0.02,plan=0.1,apply=0.2'
+
+# Upper bounds in seconds, per module where the work grows with the number of modules.
+# efficiency is a lower bound, the share of the best possible apply time achieved.
+THRESHOLDS = {
+    'import': 1.0,
+    'load_cold_per_module': 0.01,
+    'load_warm_per_module': 0.005,
+    'graph_per_module': 0.002,
+    'apply_efficiency': 0.5,
+    'incremental_per_module': 0.05,
+}
+
+_HAB = 'import sys; from hab.cli import entry; sys.argv[0] = "hab"; entry()'
+
+def parse_durations(spec):
+    pairs = ( item.split('=', 1) for item in spec.split(',') if '=' in item )
+    return { cmd.strip(): float(seconds) for cmd, seconds in pairs }
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+# The fastest any scheduler could apply the graph: no better than its longest
+# chain of modules, than spreading all of the work perfectly over the jobs, or
+# than the CPU time of starting every terraform spread over the CPUs
+def ideal_apply(dependencies, durations, waiters, jobs, spawn):
+    spawns = spawn * len(_APPLY_PHASES)
+    cost = sum(durations.get(p, 0) for p in _APPLY_PHASES) + waiters * durations.get('waiter', 0) + spawns
+    finish = {}
+    for i in sorted(dependencies):
+        finish[i] = cost + max((finish[d] for d in dependencies[i]), default=0)
+    return max(
+        max(finish.values(), default=0),
+        cost * len(dependencies) / jobs,
+        spawns * len(dependencies) / (os.cpu_count() or 1),
+    )
+
+class Project:
+    def __init__(self, root, durations, jobs):
+        self.root = root
+        self.state = root / 'state'
+        self.jobs = jobs
+        self.environ = self._environ(durations)
+
+    def _environ(self, durations):
+        bindir = self.root / 'bin'
+        bindir.mkdir(exist_ok=True)
+        wrapper = bindir / 'terraform'
+        wrapper.write_text(f'#!/bin/sh\nexec {sys.executable} {REPO / "benchmarks" / "fake_terraform.py"} "$@"\n')
+        wrapper.chmod(0o755)
+        return {
+            **os.environ,
+            'PATH': f'{bindir}:{os.environ.get("PATH", "")}',
+            'PYTHONPATH': str(REPO),
+            'HAB_BENCH_DURATIONS': ','.join(f'{k}={v}' for k, v in durations.items()),
+            'HAB_BENCH_WAITER': str(durations.get('waiter', 0)),
+        }
+
+    def environment(self):
+        return Environment(self.root / 'hab.yaml', self.root / 'modules', [ self.root / 'vars.tfvars' ], self.state)
+
+    def load(self):
+        env = self.environment()
+        biome = Biome(BIOME, env)
+        schedule = build_schedule(biome.targets, biome)
+        env.save()
+        return biome, schedule
+
+    def forget_index(self):
+        index = self.state / '.hab' / 'variables.json'
+        if index.exists():
+            index.unlink()
+
+    def hab(self, command, *args):
+        events = self.root / f'{command}-events.json'
+        cmd = [
+            sys.executable, '-c', _HAB, command, '-y', '-q',
+            '-b', BIOME,
+            '-c', str(self.root / 'hab.yaml'),
+            '-m', str(self.root / 'modules'),
+            '-s', str(self.state),
+            '--vf', str(self.root / 'vars.tfvars'),
+            '-j', str(self.jobs),
+            '--events-json', str(events),
+            *args,
+        ]
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=self.root, env=self.environ, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        duration = time.perf_counter() - start
+        if result.returncode != 0:
+            sys.stderr.write(result.stdout[-4000:])
+            raise SystemExit(f'hab {command} failed with exit code {result.returncode}')
+        with open(events) as f:
+            return duration, [ json.loads(line) for line in f ]
+
+# What starting the stand-in terraform costs, which hab can't do anything about
+def bench_spawn(project, repeat):
+    cmd = [ 'terraform', 'version' ]
+    return best_of(lambda: subprocess.run(cmd, env=project.environ, stdout=subprocess.DEVNULL, check=True), repeat)
+
+def bench_import(project, repeat):
+    cmd = [ sys.executable, '-c', 'import hab.cli' ]
+    return best_of(lambda: subprocess.run(cmd, env=project.environ, check=True), repeat)
+
+def bench_load(project, repeat):
+    def cold():
+        project.forget_index()
+        project.load()
+    cold_time = best_of(cold, repeat)
+    project.load()
+    warm_time = best_of(project.load, repeat)
+    return cold_time, warm_time
+
+def bench_graph(project, repeat):
+    biome, _ = project.load()
+    targets = biome.targets
+    return best_of(lambda: build_schedule(targets, biome), repeat)
+
+# Share of the workers' time spent running targets rather than idling
+def utilization(events, jobs):
+    run = next(e for e in events if e['event'] == 'run_finished')
+    busy = sum(e['duration'] for e in events if e['event'] == 'target_finished')
+    return busy / (run['duration'] * jobs) if run['duration'] else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hab against synthetic modules and a fake terraform')
+    parser.add_argument('--modules', type=int, default=50, help='Number of modules')
+    parser.add_argument('--width', type=int, default=10, help='Modules per layer of the dependency graph')
+    parser.add_argument('--fan-in', type=int, default=2, dest='fan_in', help='Dependencies of each module on the previous layer')
+    parser.add_argument('--variables', type=int, default=10, help='Configuration variables of each module')
+    parser.add_argument('--waiters', type=int, default=0, help='Waiters run before each module is applied')
+    parser.add_argument('--jobs', type=int, default=8, help='Targets hab executes concurrently')
+    parser.add_argument('--durations', default=_DEFAULT_DURATIONS, help='Seconds each terraform command and waiter takes, e.g. plan=0.1,waiter=0.5')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of the in-process benchmarks, the best is reported')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated project and print where it is')
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 when a result crosses its threshold')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    durations = parse_durations(args.durations)
+    workdir = tempfile.mkdtemp(prefix='hab-bench-')
+    root = PosixPath(workdir)
+    dependencies = generate(root, args.modules, args.width, args.fan_in, args.variables, waiters=args.waiters)
+    project = Project(root, durations, args.jobs)
+    print(f'{args.modules} modules, {args.width} wide, fan-in {args.fan_in}, {args.variables} variables, {args.waiters} waiters, {args.jobs} jobs')
+
+    results = {}
+    results['import'] = bench_import(project, args.repeat)
+    cold, warm = bench_load(project, args.repeat)
+    results['load_cold_per_module'] = cold / args.modules
+    results['load_warm_per_module'] = warm / args.modules
+    results['graph_per_module'] = bench_graph(project, args.repeat) / args.modules
+    print(f'      import: {results["import"] * 1000:8.1f}ms')
+    print(f'   load cold: {cold * 1000:8.1f}ms')
+    print(f'   load warm: {warm * 1000:8.1f}ms')
+    print(f'       graph: {results["graph_per_module"] * args.modules * 1000:8.1f}ms')
+
+    spawn = bench_spawn(project, args.repeat)
+    print(f'       spawn: {spawn * 1000:8.1f}ms  per terraform command')
+    apply_time, events = project.hab('apply')
+    ideal = ideal_apply(dependencies, durations, args.waiters, args.jobs, spawn)
+    results['apply_efficiency'] = ideal / apply_time
+    print(f'       apply: {apply_time:8.2f}s  best possible {ideal:.2f}s, {results["apply_efficiency"]:.0%} efficient, workers {utilization(events, args.jobs):.0%} busy')
+
+    incremental_time, events = project.hab('apply')
+    skipped = sum(1 for e in events if e['event'] == 'target_skipped')
+    results['incremental_per_module'] = incremental_time / args.modules
+    print(f' incremental: {incremental_time:8.2f}s  {skipped} of {args.modules} modules skipped')
+
+    if args.keep:
+        print(f'Project kept in {root}')
+    else:
+        shutil.rmtree(workdir)
+
+    failed = []
+    for name, value in results.items():
+        limit = THRESHOLDS[name]
+        # Efficiency should stay above its threshold, everything else below
+        if (value < limit) if name == 'apply_efficiency' else (value > limit):
+            failed.append(f'{name} {value:.4f} crossed its threshold of {limit}')
+    for failure in failed:
+        print(failure)
+    if args.check and failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Stands in for terraform when benchmarking hab. It takes the same arguments
+# hab passes to terraform, sleeps instead of doing any work and leaves behind
+# the same files: a plan, a version 4 statefile with outputs, and
+# `output -json` in the format terraform prints it.
+#
+# How long each command takes is read from HAB_BENCH_DURATIONS, for example
+# `init=0.05,validate=0.02,plan=0.2,apply=0.5`. Commands not listed return at once.
+
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+_OUTPUT = re.compile(r'^output\s+"(\w+)"', flags=re.MULTILINE)
+
+def durations():
+    spec = os.environ.get('HAB_BENCH_DURATIONS', '')
+    pairs = ( item.split('=', 1) for item in spec.split(',') if '=' in item )
+    return { cmd.strip(): float(seconds) for cmd, seconds in pairs }
+
+def parse_args(argv):
+    options, positional = {}, []
+    for arg in argv:
+        if arg.startswith('-'):
+            key, _, value = arg.lstrip('-').partition('=')
+            options[key] = value
+        else:
+            positional.append(arg)
+    return options, positional
+
+def module_outputs(inputs):
+    name = os.path.basename(os.getcwd())
+    outputs = {}
+    for tf_file in sorted(glob.glob('*.tf')):
+        with open(tf_file) as f:
+            for match in _OUTPUT.finditer(f.read()):
+                outputs[match.group(1)] = dict(sensitive=False, type='string', value=f'{match.group(1)}.{name}.example')
+    # Real modules output structured values as well, which hab has to pass through
+    outputs[f'{name}_endpoint'] = dict(
+        sensitive=False,
+        type=[ 'object', { 'host': 'string', 'port': 'number', 'inputs': 'number' } ],
+        value={ 'host': f'{name}.example', 'port': 443, 'inputs': len(inputs) },
+    )
+    return outputs
+
+def read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+def main():
+    cmd, argv = sys.argv[1], sys.argv[2:]
+    options, positional = parse_args(argv)
+    time.sleep(durations().get(cmd, 0))
+    if cmd == 'version':
+        print(json.dumps({ 'terraform_version': '0.0.0-fake' }))
+    elif cmd == 'init':
+        os.makedirs('.terraform', exist_ok=True)
+        print('Terraform has been successfully initialized!')
+    elif cmd == 'validate':
+        print('Success! The configuration is valid.')
+    elif cmd == 'plan':
+        inputs = read_json(options['var-file'], {})
+        write_json(options['out'], inputs)
+        state = read_json(options['state'], {})
+        changes = state.get('inputs') != inputs
+        print(f'Plan: {len(inputs) if changes else 0} to add, 0 to change, 0 to destroy.')
+        if 'detailed-exitcode' in options:
+            sys.exit(2 if changes else 0)
+    elif cmd == 'apply':
+        inputs = read_json(positional[0], {})
+        state = read_json(options['state'], {})
+        outputs = module_outputs(inputs)
+        write_json(options['state'], dict(
+            version=4,
+            serial=state.get('serial', 0) + 1,
+            lineage=state.get('lineage', os.path.basename(os.getcwd())),
+            outputs={ k: dict(value=v['value'], type=v['type']) for k, v in outputs.items() },
+            resources=[],
+            inputs=inputs,
+        ))
+        print(f'Apply complete! Resources: {len(inputs)} added, 0 changed, 0 destroyed.')
+    elif cmd == 'output':
+        state = read_json(options['state'], {})
+        outputs = state.get('outputs', {})
+        print(json.dumps({ k: dict(sensitive=False, **v) for k, v in outputs.items() }))
+    elif cmd == 'destroy':
+        if os.path.exists(options['state']):
+            os.remove(options['state'])
+        print('Destroy complete!')
+    else:
+        print(f'fake terraform: unsupported command {cmd}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
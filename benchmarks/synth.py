@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Generates a synthetic hab project: a habfile, a varfile and a tree of modules
+# wired together through their variables, the way real modules depend on each other.
+#
+#   python benchmarks/synth.py DIR [--modules N] [--width N] [--fan-in N] [--variables N] [--outputs N] [--waiters N]
+#
+# Modules are laid out in layers of --width, each one reading outputs of
+# --fan-in modules from the layer before it, so every module has roughly as
+# many dependents as it has dependencies.
+
+import argparse
+import json
+import os
+import random
+import stat
+from pathlib import PosixPath
+
+BIOME = 'bench'
+WAIT_SCRIPT = 'wait'
+
+CONFIG_VARIABLE = '''variable "cfg_{k}" {{
+  type        = string
+  description = "Shared configuration value {k}"
+}}
+'''
+
+INPUT_VARIABLE = '''variable "{name}" {{
+  type        = string
+  description = "Output of an upstream module"
+}}
+'''
+
+OUTPUT = '''output "{name}" {{
+  value       = "${{var.cfg_0}}-{module}-{k}"
+  description = "Output {k} of {module}"
+}}
+'''
+
+RESOURCE = '''resource "null_resource" "{module}" {{
+  triggers = {{
+{triggers}  }}
+}}
+'''
+
+# The waiter sleeps for as long as HAB_BENCH_WAITER says, in seconds
+WAIT = '''#!/bin/sh
+sleep "${HAB_BENCH_WAITER:-0}"
+'''
+
+def module_name(i):
+    return f'm{i:04d}'
+
+def output_name(i, k):
+    return f'{module_name(i)}_out_{k}'
+
+# Upstream modules of each module, picked from the previous layer
+def build_dependencies(modules, width, fan_in, seed=0):
+    rng = random.Random(seed)
+    dependencies = {}
+    for i in range(modules):
+        layer_start = i - i % width
+        previous = list(range(max(0, layer_start - width), layer_start))
+        dependencies[i] = sorted(rng.sample(previous, min(fan_in, len(previous))))
+    return dependencies
+
+def module_source(i, deps, variables, outputs):
+    name = module_name(i)
+    parts = [ CONFIG_VARIABLE.format(k=k) for k in range(variables) ]
+    parts.extend(INPUT_VARIABLE.format(name=output_name(d, 0)) for d in deps)
+    parts.extend(OUTPUT.format(name=output_name(i, k), module=name, k=k) for k in range(outputs))
+    triggers = [ f'    cfg_{k} = var.cfg_{k}\n' for k in range(variables) ]
+    triggers.extend(f'    {output_name(d, 0)} = var.{output_name(d, 0)}\n' for d in deps)
+    parts.append(RESOURCE.format(module=name, triggers=''.join(triggers)))
+    return '\n'.join(parts)
+
+def habfile(modules, dependencies, waiters, wait_script):
+    hab_modules = []
+    for i in range(modules if waiters else 0):
+        # Each waiter waits on something the module's dependencies produced
+        args = [ f'{{{output_name(d, 0)}}}' for d in dependencies[i] ] or [ 'ready' ]
+        before = [ dict(name=WAIT_SCRIPT, args=[ args[w % len(args)] ]) for w in range(waiters) ]
+        hab_modules.append(dict(name=module_name(i), before=before))
+    return dict(
+        version='1.0',
+        scripts=[ dict(name=WAIT_SCRIPT, path=str(wait_script)) ],
+        modules=hab_modules,
+        biomes=[ dict(name=BIOME, modules=[ module_name(i) for i in range(modules) ]) ],
+    )
+
+def generate(root, modules=50, width=10, fan_in=2, variables=10, outputs=2, waiters=0, seed=0):
+    root = PosixPath(root).resolve()
+    variables = max(variables, 1)
+    outputs = max(outputs, 1)
+    dependencies = build_dependencies(modules, width, fan_in, seed)
+    for i in range(modules):
+        path = root / 'modules' / module_name(i)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / 'main.tf').write_text(module_source(i, dependencies[i], variables, outputs))
+    (root / 'vars.tfvars').write_text(''.join(f'cfg_{k} = "value-{k}"\n' for k in range(variables)))
+    wait = root / WAIT_SCRIPT
+    wait.write_text(WAIT)
+    wait.chmod(wait.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    # Written as JSON, which is also YAML, to avoid needing a YAML emitter
+    (root / 'hab.yaml').write_text(json.dumps(habfile(modules, dependencies, waiters, wait), indent=2))
+    return dependencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic hab project')
+    parser.add_argument('root', help='Directory to generate the project in')
+    parser.add_argument('--modules', type=int, default=50, help='Number of modules')
+    parser.add_argument('--width', type=int, default=10, help='Modules per layer of the dependency graph')
+    parser.add_argument('--fan-in', type=int, default=2, dest='fan_in', help='Dependencies of each module on the previous layer')
+    parser.add_argument('--variables', type=int, default=10, help='Configuration variables of each module')
+    parser.add_argument('--outputs', type=int, default=2, help='Outputs of each module')
+    parser.add_argument('--waiters', type=int, default=0, help='Waiters run before each module is applied')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for picking dependencies')
+    args = parser.parse_args()
+    os.makedirs(args.root, exist_ok=True)
+    generate(args.root, args.modules, args.width, args.fan_in, args.variables, args.outputs, args.waiters, args.seed)
+    print(f'Generated {args.modules} modules in {args.root}')
+
+if __name__ == '__main__':
+    main()
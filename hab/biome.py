@@ -2,9 +2,11 @@ from .error import (AmbiguousProvidesError, InvalidBiomeError,
                     InvalidModuleError)
 from .stage import Target
 from .util.decs import as_list
-from .tfvars import TFVars
+from .tfvars import InputPlan, VarFileLoader
 from .util.type import is_iterable, is_string
 from .util.log import Log
+from itertools import chain
+from threading import Lock
 
 _log = Log('biome')
 
@@ -18,6 +20,9 @@ class Biome:
         self._stages = None
         self._start_at = start_at
         self._stop_at = stop_at
+        self._producers = None
+        self._input_plans = {}
+        self._lock = Lock()
         if not self._has_biome:
             raise InvalidBiomeError(self.name)
 
@@ -41,6 +46,7 @@ class Biome:
                     _log.debug(f'Selected module {name}')
                     biomes_modules[name] = self._env.modules[name]
                 break
+        self._env.discover(biomes_modules.values())
         return biomes_modules
 
     @property
@@ -61,7 +67,15 @@ class Biome:
                             provider
                         )
                 _log.debug(f'Added Target {provider} from {module.name}')
-                targets[provider] = Target(provider, module)
+                targets[provider] = Target(
+                        provider,
+                        module,
+                        timings=self._env.timings,
+                        fingerprints=self._env.fingerprints,
+                        plugin_cache=self._env.plugin_cache,
+                        logs=self._env.logs,
+                        flights=self._env.waiter_flights
+                    )
                 targets[targets[provider].id] = targets[provider]
         return targets
 
@@ -69,4 +83,27 @@ class Biome:
     def targets(self):
         if self._targets is None:
             self._targets = self._build_targets()
-        return self._targets
\ No newline at end of file
+        return self._targets
+
+    # Later varfiles take precedence, so module outputs override CLI varfiles
+    def _build_producers(self):
+        _log.debug('Indexing variable producers...')
+        module_varfiles = [ VarFileLoader.from_module(m, self._env.outputs) for m in self._modules.values() ]
+        producers = {}
+        for varfile in chain(self._env.varfiles, module_varfiles):
+            for key in varfile.keys:
+                producers[key] = varfile
+        return producers
+
+    def _build_input_plan(self, target):
+        module = target.module
+        keys = chain(module.input_variables, *(w.args for w in chain(module.before, module.after)))
+        return InputPlan({ k: self._producers.get(k) for k in keys })
+
+    def input_plan(self, target):
+        with self._lock:
+            if self._producers is None:
+                self._producers = self._build_producers()
+            if target not in self._input_plans:
+                self._input_plans[target] = self._build_input_plan(target)
+            return self._input_plans[target]
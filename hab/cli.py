@@ -2,10 +2,16 @@ import sys
 import os.path
 from pathlib import PosixPath
 import argparse
+import logging
 from .env import Environment
 from .biome import Biome
 from .runner import Runner
-from .stage import build_stages
+from .stage import build_schedule
+from .util.console import console
+from .util.events import events
+from .util.log import set_level
+from .util.trace import tracer
+from .util.profile import profiled
 
 def _exit(status):
     exit_code = 0 if status else 1
@@ -48,6 +54,18 @@ def file_type(path):
         _exit(False)
     return resolved
 
+def seconds_type(value):
+    seconds = float(value)
+    if seconds < 0:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number of seconds')
+    return seconds
+
+def jobs_type(value):
+    jobs = int(value)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number of jobs')
+    return jobs
+
 def get_args(*args):
     parser = argparse.ArgumentParser(
 		prog=os.path.basename(sys.argv[0]),
@@ -62,6 +80,15 @@ def get_args(*args):
     parser.add_argument('--start-at', action='store', dest='start_at', default=None, help='Start at this module, ignoring dependencies.')
     parser.add_argument('--stop-at', action='store', dest='stop_at', default=None, help='Stop executing at the module.')
     parser.add_argument('-b', '--biome', action='store', required=True, help='Biome to apply')
+    parser.add_argument('-f', '--force', action='store_true', help='Apply every module, even those unchanged since their last apply.')
+    parser.add_argument('--reinit', action='store_true', help='Run terraform init even for modules that are already initialised.')
+    parser.add_argument('--compress-logs', action='store_true', dest='compress_logs', help='Gzip the per-module logs kept in the state directory.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only show what each module is doing, command output is still logged to the state directory.')
+    parser.add_argument('--events-json', action='store', default=None, dest='events_json', metavar='FILE', help='Write one JSON object per target and phase lifecycle event to FILE, or to stdout with -.')
+    parser.add_argument('--trace', action='store', default=None, type=path_type, metavar='FILE', help='Write a Chrome trace of the run to FILE, for viewing in Perfetto.')
+    parser.add_argument('--profile', action='store', nargs='?', default=None, const='hab.prof', type=path_type, metavar='FILE', help='Profile hab itself and write the stats to FILE, hab.prof by default.')
+    parser.add_argument('--waiter-ttl', action='store', default=60, type=seconds_type, dest='waiter_ttl', metavar='SECONDS', help='Reuse a waiter that succeeded with the same arguments this many seconds ago. Defaults to 60, 0 always waits again.')
+    parser.add_argument('-j', '--jobs', action='store', default=None, type=jobs_type, help='Number of targets to execute concurrently. Defaults to the number of CPUs.')
     return parser.parse_args(*args)
 
 def cmd(name):
@@ -89,8 +116,8 @@ def return_as_exit_code(func):
     return inner
 
 def with_runner(func):
-    def inner(flags, stages, *args, **kwargs):
-        runner = Runner(stages)
+    def inner(flags, schedule, *args, **kwargs):
+        runner = Runner(schedule, max_workers=flags.jobs)
         return func(flags, runner, *args, **kwargs)
     return inner
 
@@ -106,46 +133,59 @@ def default_cmd(name):
 @return_as_exit_code
 @with_runner
 def init(flags, runner):
-    runner.execute('init')
+    return runner.execute('init', reinit=flags.reinit)
 
 @cmd('validate')
 @ask_for_confirmation('Really do this?')
 @return_as_exit_code
 @with_runner
 def validate(flags, runner):
-    runner.execute('validate')
+    return runner.execute('validate', reinit=flags.reinit)
 
 @cmd('apply')
 @ask_for_confirmation('Really do this?')
 @return_as_exit_code
 @with_runner
 def apply(flags, runner):
-    runner.execute('apply')
+    return runner.execute('apply', force=flags.force, reinit=flags.reinit)
 
 @cmd('plan')
 @ask_for_confirmation('Really do this?')
 @return_as_exit_code
 @with_runner
 def plan(flags, runner):
-    runner.execute('plan')
+    return runner.execute('plan', reinit=flags.reinit)
 
 @cmd('fclean')
 @ask_for_confirmation('Really do this?')
 @return_as_exit_code
 @with_runner
 def fclean(flags, runner):
-    runner.execute('fclean')
+    return runner.execute('fclean')
 
 @cmd('destroy')
 @ask_for_confirmation('Really do this?')
 @return_as_exit_code
-def destroy(flags, stages):
-    runner = Runner(list(reversed(stages)))
-    runner.execute('destroy')
+def destroy(flags, schedule):
+    runner = Runner(schedule.reversed(), max_workers=flags.jobs)
+    return runner.execute('destroy')
 
 def entry():
     args = get_args()
-    env = Environment(args.config, args.modules_dir, args.varfiles, args.state_dir)
-    biome = Biome(args.biome, env)
-    stages = build_stages(biome.targets, biome)
-    args.command(args, stages)
+    if args.quiet:
+        console.quiet = True
+        set_level(logging.INFO)
+    if args.events_json is not None:
+        events.open(args.events_json)
+    if args.trace is not None:
+        tracer.open(args.trace)
+    with profiled(args.profile):
+        env = Environment(args.config, args.modules_dir, args.varfiles, args.state_dir, compress_logs=args.compress_logs, waiter_ttl=args.waiter_ttl)
+        biome = Biome(args.biome, env)
+        schedule = build_schedule(biome.targets, biome)
+        env.save()
+        try:
+            args.command(args, schedule)
+        finally:
+            # Timings recorded during the run are only written now
+            env.save()
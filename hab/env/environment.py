@@ -1,41 +1,72 @@
+import os
 from itertools import chain
+from pathlib import PosixPath
 
 from ..parse import parse_habfile
 from ..tfvars import VarFileLoader
 from ..util.decs import as_dict, as_list
 from ..util.log import Log
-from .module import TFModule
-from .waiter import Script, Waiter
+from ..util.trace import traced
+from .module import TFModule, has_tf_files
+from .index import VariableIndex
+from .waiter import NativeWaiter, Script, Waiter, WaiterFlights
 from ..error import InvalidModuleError
+from ..stage.timings import TimingStore
+from ..stage.fingerprints import FingerprintStore
+from ..stage.logs import LogStore
+from ..outputs import OutputStore
+from ..plugins import PluginCache
 
 _log = Log('environment')
 
 class Environment:
-    def __init__(self, habfile_path, modules_dir, varfile_paths, state_dir):
+    def __init__(self, habfile_path, modules_dir, varfile_paths, state_dir, compress_logs=False, waiter_ttl=0):
         self._habfile_path = habfile_path
         self._modules_dir = modules_dir
         self._varfile_paths = varfile_paths
         self._state_dir = state_dir
+        self._compress_logs = compress_logs
+        self._waiter_ttl = waiter_ttl
         self._varfiles = None
         self._modules = None
         self._habfile = None
         self._scripts = None
+        self._timings = None
+        self._fingerprints = None
+        self._outputs = None
+        self._plugin_cache = None
+        self._logs = None
+        self._variable_index = None
+        self._waiter_flights = None
 
     def _get_statefile(self, module):
         if not self._state_dir.exists():
             self._state_dir.mkdir()
         return self._state_dir / f'{module}.tfstate'
 
+    # Bookkeeping hab keeps between runs lives alongside the statefiles
+    def _get_cache_path(self, name):
+        cache_dir = self._state_dir / '.hab'
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir / name
+
+    @traced('parse habfile')
     def _load_habfile(self):
         _log.debug('Loading habfile...')
         with open(self._habfile_path) as f:
             return parse_habfile(f.read())
 
+    def _scan_modules(self):
+        with os.scandir(self._modules_dir) as entries:
+            dirs = sorted(e.path for e in entries if e.is_dir())
+        return [ PosixPath(d) for d in dirs if has_tf_files(d) ]
+
+    @traced('discover modules')
     @as_dict
     def _load_modules(self):
         _log.debug('Loading modules...')
         hab_modules = { m.name: m for m in self.habfile.modules }
-        for path in filter(lambda p: p.is_dir() and len(list(p.glob('*.tf'))), self._modules_dir.glob('*')):
+        for path in self._scan_modules():
             kwargs = {}
             if path.name in hab_modules:
                 kwargs['depends_on'] = hab_modules[path.name].depends_on
@@ -43,8 +74,9 @@ class Environment:
                 kwargs['provides'] = hab_modules[path.name].provides if hab_modules[path.name].provides else None
                 kwargs['before'] = self._build_before(hab_modules[path.name]) if hab_modules[path.name].before else None
                 kwargs['after'] = self._build_after(hab_modules[path.name]) if hab_modules[path.name].after else None
+                kwargs['parallel_waiters'] = hab_modules[path.name].parallel_waiters
             _log.debug(f'Found module {path.name}, depends on: {kwargs.get("depends_on")}, provides: {kwargs.get("provides")}')
-            yield path.name, TFModule(path.name, path, self._get_statefile(path.name), **kwargs)
+            yield path.name, TFModule(path.name, path, self._get_statefile(path.name), index=self.variable_index, **kwargs)
 
     @as_list
     def _load_varfiles(self):
@@ -56,10 +88,14 @@ class Environment:
     @as_list
     def _build_waiters(self, module, scripts):
         for script in scripts:
+            kwargs = dict(timeout=script.timeout, interval=script.interval, max_interval=script.max_interval)
+            if script.type is not None:
+                yield NativeWaiter(script.type, script.params, name=script.name, **kwargs)
+                continue
             _script = self.scripts.get(script.name)
             if not _script:
                 raise InvalidModuleError(module)
-        yield Waiter(_script, script.args)
+            yield Waiter(_script, script.args, **kwargs)
 
     def _build_before(self, module):
         return self._build_waiters(module.name, module.before)
@@ -96,3 +132,58 @@ class Environment:
         if self._scripts is None:
             self._scripts = self._load_scripts()
         return self._scripts
+
+    @property
+    def timings(self):
+        if self._timings is None:
+            self._timings = TimingStore(self._get_cache_path('timings.json'))
+        return self._timings
+
+    @property
+    def fingerprints(self):
+        if self._fingerprints is None:
+            self._fingerprints = FingerprintStore(self._get_cache_path('fingerprints.json'))
+        return self._fingerprints
+
+    @property
+    def logs(self):
+        if self._logs is None:
+            self._logs = LogStore(self._get_cache_path('logs'), compress=self._compress_logs)
+        return self._logs
+
+    @property
+    def outputs(self):
+        if self._outputs is None:
+            self._outputs = OutputStore(self._get_cache_path('outputs.json'))
+        return self._outputs
+
+    @property
+    def plugin_cache(self):
+        if self._plugin_cache is None:
+            self._plugin_cache = PluginCache(self._get_cache_path('plugin-cache'))
+        return self._plugin_cache
+
+    @property
+    def waiter_flights(self):
+        if self._waiter_flights is None:
+            self._waiter_flights = WaiterFlights(self._waiter_ttl)
+        return self._waiter_flights
+
+    @property
+    def variable_index(self):
+        if self._variable_index is None:
+            self._variable_index = VariableIndex(self._get_cache_path('variables.json'))
+        return self._variable_index
+
+    # Parses the variables of many modules at once rather than one at a time
+    @traced('discover variables')
+    def discover(self, modules):
+        _log.debug('Discovering module variables...')
+        self.variable_index.prefetch(chain.from_iterable(m.tf_files for m in modules))
+
+    # Persists anything discovered about the environment for the next run
+    def save(self):
+        if self._variable_index is not None:
+            self._variable_index.save()
+        if self._timings is not None:
+            self._timings.save()
@@ -0,0 +1,105 @@
+import concurrent.futures
+import hashlib
+import os
+from ..parse import parse_tf_variable_names
+from ..util.log import Log
+from ..util.store import JSONStore
+
+_log = Log('environment.index')
+
+# Bump whenever parsing changes what is extracted from a file
+_INDEX_VERSION = 2
+# Below this many files a worker pool costs more than it saves
+_MIN_PARALLEL_FILES = 16
+
+def _parse(text):
+    return parse_tf_variable_names(text)
+
+def _read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+# Runs in a worker process, so it takes and returns plain values
+def _parse_file(path):
+    data, digest = _read(path)
+    return (digest, *_parse(data.decode('utf-8')))
+
+# Caches the variables parsed out of each .tf file between runs.
+# Files whose mtime and size are unchanged are never read again,
+# files that were only touched are recognised by their content hash.
+class VariableIndex(JSONStore):
+    _description = 'variable index'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._seen = set()
+
+    def _decode(self, data):
+        if data.get('version') != _INDEX_VERSION:
+            return {}
+        return data.get('files', {})
+
+    def _encode(self, data):
+        return dict(version=_INDEX_VERSION, files=data)
+
+    def _lookup(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            self._seen.add(str(path))
+            entry = self._data.get(str(path))
+        if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return stat, entry, True
+        return stat, entry, False
+
+    def _update(self, path, stat, digest, inputs, outputs):
+        with self._lock:
+            self._data[str(path)] = dict(mtime=stat.st_mtime_ns, size=stat.st_size, hash=digest, inputs=inputs, outputs=outputs)
+            self._dirty = True
+
+    def variables(self, path):
+        stat, entry, fresh = self._lookup(path)
+        if fresh:
+            return entry['inputs'], entry['outputs']
+        data, digest = _read(path)
+        if entry and entry['hash'] == digest:
+            inputs, outputs = entry['inputs'], entry['outputs']
+        else:
+            _log.debug(f'Parsing variables from {path}')
+            inputs, outputs = _parse(data.decode('utf-8'))
+        self._update(path, stat, digest, inputs, outputs)
+        return inputs, outputs
+
+    # Parses every stale file up front, spread across a pool of processes
+    def prefetch(self, paths, max_workers=None):
+        stale = []
+        for path in paths:
+            stat, _, fresh = self._lookup(path)
+            if not fresh:
+                stale.append((path, stat))
+        workers = min(max_workers or os.cpu_count() or 1, len(stale) // _MIN_PARALLEL_FILES)
+        if workers < 2:
+            for path, _ in stale:
+                self.variables(path)
+            return
+        _log.debug(f'Parsing {len(stale)} files with {workers} workers')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(stale) // (workers * 4))
+            results = executor.map(_parse_file, [ p for p, _ in stale ], chunksize=chunksize)
+            for (path, stat), (digest, inputs, outputs) in zip(stale, results):
+                self._update(path, stat, digest, inputs, outputs)
+
+    # Entries of files this run didn't look at are only kept while the file is
+    # still there, they may belong to modules of another biome
+    def _prune(self):
+        gone = [ path for path in self._data if path not in self._seen and not os.path.exists(path) ]
+        for path in gone:
+            del self._data[path]
+        if gone:
+            _log.debug(f'Dropped {len(gone)} files that no longer exist from the variable index')
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            self._prune()
+        super().save()
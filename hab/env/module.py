@@ -1,9 +1,45 @@
+import os
+from pathlib import PosixPath
 from uuid import uuid4
-from ..parse import parse_tf_input, parse_tf_output
+from ..parse import parse_tf_variable_names
 from ..util.decs import as_list
 
+# Directories terraform manages itself, vendored modules live here
+_IGNORED_DIRS = [ '.terraform' ]
+
+def _is_tf_file(entry):
+    return entry.name.endswith('.tf') and entry.is_file()
+
+def has_tf_files(path):
+    with os.scandir(path) as entries:
+        return any(_is_tf_file(e) for e in entries)
+
+# Yields the files of a module in name order
+def _walk_files(path):
+    dirs = [ path ]
+    while dirs:
+        current = dirs.pop()
+        with os.scandir(current) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            if entry.is_file():
+                yield entry
+        # Pushed in reverse so subdirectories are still visited in name order
+        dirs.extend(reversed([ e.path for e in entries if e.is_dir() and e.name not in _IGNORED_DIRS ]))
+
+@as_list
+def find_tf_files(path):
+    for entry in _walk_files(path):
+        if entry.name.endswith('.tf'):
+            yield PosixPath(entry.path)
+
+@as_list
+def find_module_files(path):
+    for entry in _walk_files(path):
+        yield PosixPath(entry.path)
+
 class TFModule:
-    def __init__(self, name, path, statefile, provides=None, depends_on=None, should_destroy=True, before=None, after=None):
+    def __init__(self, name, path, statefile, provides=None, depends_on=None, should_destroy=True, before=None, after=None, parallel_waiters=False, index=None):
         self.id = uuid4().hex
         self.name = name
         self.path = path
@@ -14,21 +50,39 @@ class TFModule:
         self.should_destroy = should_destroy
         self.before = before if before is not None else list()
         self.after = after if after is not None else list()
+        self.parallel_waiters = parallel_waiters
+        self._index = index
+        self._tf_files = None
 
         self._input_vars = None
         self._output_vars = None
         self._discovered = False
 
+    @property
+    def tf_files(self):
+        if self._tf_files is None:
+            self._tf_files = find_tf_files(self.path)
+        return self._tf_files
+
+    # Everything that makes up the module, templates and other files included
+    @property
+    def source_files(self):
+        return find_module_files(self.path)
+
     def _discover_variables(self):
         input_vars = []
         output_vars = []
-        for tf_file in self.path.rglob('*.tf'):
+        for tf_file in self.tf_files:
+            if self._index is not None:
+                inputs, outputs = self._index.variables(tf_file)
+                input_vars.extend(inputs)
+                output_vars.extend(outputs)
+                continue
             with open(tf_file) as f:
                 txt = f.read()
-            for tfvar in parse_tf_input(txt):
-                input_vars.append(tfvar.name)
-            for tfvar in parse_tf_output(txt):
-                output_vars.append(tfvar.name)
+            inputs, outputs = parse_tf_variable_names(txt)
+            input_vars.extend(inputs)
+            output_vars.extend(outputs)
         self._input_vars = input_vars
         self._output_vars = output_vars
         self._discovered = True
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import re
+import socket
+import ssl
+from functools import wraps
+from urllib.parse import urlsplit
+from ..error import ProbeFailedError
+
+# Readiness checks hab runs itself rather than through a script. Each returns
+# once the check passes and raises ProbeFailedError or OSError when it doesn't.
+
+# Most of a response body that is searched for a match
+_MAX_BODY = 1 << 20
+# What a server that is half started or misbehaving makes a probe raise, which only means it isn't ready.
+# UnicodeError comes from encoding hostnames that aren't valid, ValueError from garbled responses.
+_NOT_READY = (asyncio.IncompleteReadError, asyncio.LimitOverrunError, UnicodeError, ValueError)
+
+def _not_ready(func):
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except _NOT_READY as e:
+            raise ProbeFailedError(f'{func.__name__} probe failed, {e!r}') from e
+    return inner
+
+@_not_ready
+async def tcp(host, port):
+    _, writer = await asyncio.open_connection(host, int(port))
+    writer.close()
+
+async def _read_chunked(reader):
+    body = b''
+    while len(body) < _MAX_BODY:
+        size = int((await reader.readline()).split(b';', 1)[0], 16)
+        if size == 0:
+            break
+        body += await reader.readexactly(size)
+        await reader.readline()
+    return body
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        return await _read_chunked(reader)
+    if 'content-length' in headers:
+        return await reader.readexactly(min(int(headers['content-length']), _MAX_BODY))
+    return await reader.read(_MAX_BODY)
+
+async def _request(url, method, insecure):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ProbeFailedError(f'{url} is not an http or https url')
+    context = None
+    if parts.scheme == 'https':
+        context = ssl.create_default_context()
+        if insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or (443 if context else 80), ssl=context)
+    target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    try:
+        writer.write((
+            f'{method} {target} HTTP/1.1\r\n'
+            f'Host: {parts.netloc.rsplit("@", 1)[-1]}\r\n'
+            'User-Agent: hab\r\n'
+            'Accept: */*\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode())
+        await writer.drain()
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+# Passes on a status in `status`, any 2xx or 3xx when it isn't given,
+# and when `match` is given only if the body matches it as a regex
+@_not_ready
+async def http(url, status=None, match=None, method='GET', insecure=False):
+    reader, writer = await _request(url, method, insecure)
+    try:
+        status_line = (await reader.readline()).decode('latin-1').split(None, 2)
+        if len(status_line) < 2 or not status_line[1].isdigit():
+            raise ProbeFailedError(f'{url} did not answer with http')
+        code = int(status_line[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        expected = status if isinstance(status, list) else [ status ] if status is not None else None
+        if (code not in expected) if expected is not None else not 200 <= code < 400:
+            raise ProbeFailedError(f'{url} answered {code}')
+        if match is not None:
+            body = (await _read_body(reader, headers)).decode('utf-8', errors='replace')
+            if re.search(match, body) is None:
+                raise ProbeFailedError(f'{url} did not match {match}')
+    finally:
+        writer.close()
+
+# Passes once name resolves, to address when it's given
+@_not_ready
+async def dns(name, address=None):
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+    addresses = { info[4][0] for info in infos }
+    if address is not None and address not in addresses:
+        raise ProbeFailedError(f'{name} resolves to { ", ".join(sorted(addresses)) }, not {address}')
+
+# Passes once path exists and, when `match` is given, its contents match it as a regex
+@_not_ready
+async def file(path, match=None):
+    if match is None:
+        if not os.path.exists(path):
+            raise ProbeFailedError(f'{path} does not exist')
+        return
+    with open(path, errors='replace') as f:
+        text = f.read(_MAX_BODY)
+    if re.search(match, text) is None:
+        raise ProbeFailedError(f'{path} did not match {match}')
+
+PROBES = {
+    'tcp': tcp,
+    'http': http,
+    'dns': dns,
+    'file': file,
+}
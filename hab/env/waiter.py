@@ -1,34 +1,245 @@
+import asyncio
+import json
+import random
+from abc import ABC, abstractmethod
+from functools import partial
 import re
+from ..error import ProbeFailedError
 from ..util.decs import as_list
-from ..util.proc import run as procrun
+from ..util.log import Log
+from ..util.proc import run_async as procrun_async
+from .probes import PROBES
 _ARG_FORMAT = re.compile(r'{([a-zA-Z][a-zA-z0-9-_]+)}')
 
+_log = Log('waiter')
+
+# Delay before the first retry, doubled after every failed attempt up to the maximum
+_DEFAULT_INTERVAL = 1
+_DEFAULT_MAX_INTERVAL = 30
+# How long native waiters keep probing unless told otherwise, and how long one probe may take
+_DEFAULT_PROBE_DEADLINE = 300
+_PROBE_TIMEOUT = 10
+
 class Script:
     def __init__(self, name, path):
         self.name = name
         self.path = path
-      
+
     def cmd(self, *args):
         return f'{self.path} {" ".join(args)}'
 
-class Waiter:
-    def __init__(self, script, flags):
-        self._script = script
-        self._flags = flags
+# Runs a check until it succeeds. Without a timeout the check is run once, with
+# one hab retries it with exponential backoff and full jitter until the timeout,
+# cutting short an attempt that runs past it.
+class BaseWaiter(ABC):
+    # Longest a single attempt may take on top of the overall timeout
+    _attempt_timeout = None
+
+    def __init__(self, timeout=None, interval=None, max_interval=None):
+        self._timeout = timeout
+        self._interval = interval if interval is not None else _DEFAULT_INTERVAL
+        self._max_interval = max_interval if max_interval is not None else _DEFAULT_MAX_INTERVAL
         self._args = None
 
+    @property
+    @abstractmethod
+    def name(self):
+        pass
+
+    # Strings that may reference variables, such as {rancher_host}
+    @abstractmethod
+    def _templates(self):
+        pass
+
     @as_list
     def _extract_templated_args(self):
-        for flag in self._flags:
-            for match in _ARG_FORMAT.finditer(flag):
+        for template in self._templates():
+            for match in _ARG_FORMAT.finditer(template):
                 yield match.group(1)
+
     @property
     def args(self):
         if self._args is None:
             self._args = self._extract_templated_args()
         return self._args
 
-    def execute(self, **kwargs):
-        _flags = [ f.format(**kwargs) for f in self._flags ]
-        retcode, stdout = procrun(self._script.cmd(*_flags))
+    # How long and how often the check is run, waiters only share a wait when these match too
+    @property
+    def _timing(self):
+        return self._timeout, self._interval, self._max_interval
+
+    # Identifies what is being waited on, the same for waiters that wait on the same thing
+    @abstractmethod
+    def key(self, args):
+        pass
+
+    @abstractmethod
+    async def _check(self, args, prefix):
+        pass
+
+    async def _attempt(self, args, prefix, timeout):
+        if self._attempt_timeout is not None:
+            timeout = self._attempt_timeout if timeout is None else min(timeout, self._attempt_timeout)
+        try:
+            return await asyncio.wait_for(self._check(args, prefix), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    # Returns whether the check succeeded and how many times it was run
+    async def wait(self, args, prefix=None):
+        if self._timeout is None:
+            return await self._attempt(args, prefix, None), 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout
+        interval = self._interval
+        attempts = 0
+        while True:
+            attempts += 1
+            if await self._attempt(args, prefix, deadline - loop.time()):
+                return True, attempts
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                _log.warning(f'{self.name} did not succeed within {self._timeout}s, gave up after {attempts} attempts')
+                return False, attempts
+            delay = min(random.uniform(0, interval), remaining)
+            _log.debug(f'{self.name} failed, retrying in {delay:.1f}s')
+            await asyncio.sleep(delay)
+            interval = min(interval * 2, self._max_interval)
+
+# Runs a user defined script, which is expected to do its own polling unless given a timeout
+class Waiter(BaseWaiter):
+    def __init__(self, script, flags, **kwargs):
+        super().__init__(**kwargs)
+        self._script = script
+        self._flags = flags
+
+    @property
+    def name(self):
+        return self._script.name
+
+    @property
+    def script(self):
+        return self._script
+
+    def _templates(self):
+        return self._flags
+
+    def format(self, args):
+        _flags = [ f.format(**args) for f in self._flags ]
+        return self._script.cmd(*_flags)
+
+    def key(self, args):
+        return ('script', self.format(args), *self._timing)
+
+    async def _check(self, args, prefix):
+        # In a session of its own so that cancelling it also stops whatever it started
+        retcode, _, _ = await procrun_async(self.format(args), prefix=prefix, start_new_session=True)
         return retcode == 0
+
+# Runs one of hab's own probes, see probes.py, in place of a script. A single
+# probe can't wait for anything, so these are retried for a while by default.
+class NativeWaiter(BaseWaiter):
+    _attempt_timeout = _PROBE_TIMEOUT
+
+    def __init__(self, kind, params, name=None, timeout=None, **kwargs):
+        super().__init__(timeout=timeout if timeout is not None else _DEFAULT_PROBE_DEADLINE, **kwargs)
+        self._kind = kind
+        self._probe = PROBES[kind]
+        self._params = params
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name or self._kind
+
+    def _templates(self):
+        return [ v for v in self._params.values() if isinstance(v, str) ]
+
+    # Only the placeholders args were collected for are replaced, params like
+    # regexes may contain braces of their own
+    def format(self, args):
+        def substitute(value):
+            return _ARG_FORMAT.sub(lambda m: str(args[m.group(1)]), value)
+        return { k: substitute(v) if isinstance(v, str) else v for k, v in self._params.items() }
+
+    def key(self, args):
+        return (self._kind, json.dumps(self.format(args), sort_keys=True), *self._timing)
+
+    async def _check(self, args, prefix):
+        params = self.format(args)
+        try:
+            await self._probe(**params)
+        except (OSError, ProbeFailedError) as e:
+            _log.debug(f'{self.name} of {prefix} is not ready: {e}')
+            return False
+        return True
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiting = 0
+
+# Shares waits between targets running the same waiter with the same arguments.
+# A wait already in flight is joined rather than started again, and one that
+# succeeded less than ttl seconds ago isn't repeated at all. Only used from
+# hab's event loop, which is what keeps it free of locks.
+class WaiterFlights:
+    def __init__(self, ttl=0):
+        self._ttl = ttl
+        self._flights = {}
+        self._succeeded = {}
+
+    # A flight may have been replaced by the time it lands, the newer one is left alone
+    def _landed(self, key, flight, task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not task.cancelled() and task.exception() is None and task.result()[0]:
+            self._succeeded[key] = asyncio.get_running_loop().time()
+
+    # Returns the same as Waiter.wait, with no attempts when a recent success was reused
+    async def wait(self, waiter, args, prefix=None):
+        loop = asyncio.get_running_loop()
+        key = waiter.key(args)
+        succeeded = self._succeeded.get(key)
+        if succeeded is not None and loop.time() - succeeded < self._ttl:
+            _log.debug(f'{waiter.name} succeeded {loop.time() - succeeded:.1f}s ago, not waiting again')
+            return True, 0
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(waiter.wait(args, prefix)))
+            flight.task.add_done_callback(partial(self._landed, key, flight))
+        else:
+            _log.debug(f'{waiter.name} is already being waited on, joining it')
+        flight.waiting += 1
+        try:
+            # Shielded so one target giving up doesn't cancel the wait for the others
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiting == 1:
+                # Forgotten straight away so that nobody joins it while it winds down
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiting -= 1
+
+# Waits on every probe, a function returning a coroutine that resolves to whether
+# it succeeded. Probes run one after another or all at once, either way the first
+# failure cancels those still running and skips those yet to start.
+async def wait_all(probes, parallel=False):
+    if not parallel:
+        for probe in probes:
+            if not await probe():
+                return False
+        return True
+    tasks = [ asyncio.ensure_future(probe()) for probe in probes ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            if not await task:
+                return False
+        return True
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
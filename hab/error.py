@@ -15,3 +15,15 @@ class InvalidModuleError(HabitatError):
 
 class UnexpectedFlagError(HabitatError):
     _msg = 'Unexpected flag %s!'
+
+class CircularDependencyError(HabitatError):
+    _msg = 'Circular dependency %s!'
+
+class HCLSyntaxError(HabitatError):
+    _msg = 'Invalid HCL, %s!'
+
+class ProbeFailedError(HabitatError):
+    _msg = '%s'
+
+class InvalidVarFileError(HabitatError):
+    _msg = 'Could not read varfile %s: %s'
@@ -4,9 +4,9 @@ from .util.decs import as_tuple
 HabFile = namedtuple('HabFile', ['habitats', 'biomes', 'modules', 'scripts', 'version'])
 Habitat = namedtuple('Habitat', ['name', 'biomes'] )
 Biome = namedtuple('Biome', ['name', 'modules'])
-Module = namedtuple('Module', ['name', 'should_destroy', 'before', 'after', 'provides', 'depends_on'])
+Module = namedtuple('Module', ['name', 'should_destroy', 'before', 'after', 'provides', 'depends_on', 'parallel_waiters'])
 Script = namedtuple('Script', ['name', 'path'])
-ModuleScript = namedtuple('ModuleScript', ['name', 'args'])
+ModuleScript = namedtuple('ModuleScript', ['name', 'args', 'type', 'params', 'timeout', 'interval', 'max_interval'])
 ModuleScriptArg = namedtuple('ModuleScriptArg', ['name', 'module'])
 
 @as_tuple
@@ -15,6 +15,11 @@ def _load_module_scripts(data):
         yield ModuleScript(
             name=script.get('name'),
             args=tuple(script.get('args', [])),
+            type=script.get('type'),
+            params=dict(script.get('params', {})),
+            timeout=script.get('timeout'),
+            interval=script.get('interval'),
+            max_interval=script.get('max_interval'),
         )
 
 @as_tuple
@@ -26,7 +31,8 @@ def _load_modules(data):
             provides=tuple(module.get('provides', [])),
             depends_on=tuple(module.get('depends_on', [])),
             before=_load_module_scripts(module.get('before', [])),
-            after=_load_module_scripts(module.get('after', []))
+            after=_load_module_scripts(module.get('after', [])),
+            parallel_waiters=module.get('parallel_waiters', False)
         )
 
 @as_tuple
@@ -0,0 +1,414 @@
+import json
+import re
+from collections import namedtuple
+from .error import HCLSyntaxError
+
+# A streaming tokenizer and parser for the subset of HCL hab needs to understand:
+# top-level blocks and attributes, nested blocks, and literal values.
+# Expressions are kept as their source text, blocks nobody asked for are skipped
+# without tokenizing their contents.
+
+Token = namedtuple('Token', ['kind', 'value', 'start', 'end'])
+
+class Patterns:
+    # Whitespace and comments are consumed along with the token that follows them
+    token = re.compile(r'''
+        [ \t\r]*(?:(?:\#[^\n]*|//[^\n]*|/\*.*?\*/)[ \t\r]*)*
+        (?:(?P<newline>\n)
+        |(?P<heredoc><<(?P<indent>-?)(?P<marker>[A-Za-z_][\w-]*)[ \t]*\r?\n)
+        |(?P<string>"[^"\\$%\n]*(?:(?:\\.|\$\$\{|%%\{|[$%](?!\{))[^"\\$%\n]*)*")
+        |(?P<simple_template>"[^"\\$%\n]*(?:(?:\\.|[$%](?!\{)|[$%]\{[^{}"\n]*\})[^"\\$%\n]*)*")
+        |(?P<template>")
+        |(?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+        |(?P<ident>[A-Za-z_][\w-]*)
+        |(?P<op>==|!=|<=|>=|&&|\|\||=>|\.\.\.|[{}\[\]()=,:.?!<>+\-*/%~])
+        |(?P<eof>\Z)
+        |(?P<invalid>.))
+    ''', flags=re.VERBOSE | re.DOTALL)
+    template_part = re.compile(r'[^"\\$%]+|\\.|\$\$\{|%%\{|[$%]\{|[$%]|"', flags=re.DOTALL)
+    # A block header in one go, including any whitespace and comments before it
+    header = re.compile(r'''
+        \s*(?:(?:\#[^\n]*|//[^\n]*|/\*.*?\*/)\s*)*
+        (?P<type>[A-Za-z_][\w-]*)
+        (?P<labels>(?:[ \t]*"[^"\\\n]*(?:\\.[^"\\\n]*)*"|[ \t]+[A-Za-z_][\w-]*)*)
+        [ \t]*\{
+    ''', flags=re.VERBOSE | re.DOTALL)
+    label = re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"|[A-Za-z_][\w-]*')
+    # Consumes a run of uninteresting text, including simple strings and
+    # singly nested braces, then stops on the next thing that affects brace depth
+    skip = re.compile(r'''
+        [^"{}\#/<]*
+        (?:(?:"[^"\\$%\n]*(?:(?:\\.|[$%](?!\{)|[$%]\{[^{}"\n]*\})[^"\\$%\n]*)*"
+            |/(?![/*])
+            |<(?!<-?[A-Za-z_])
+            |\{[^"{}\#/<]*
+                (?:(?:"[^"\\$%\n]*(?:(?:\\.|[$%](?!\{)|[$%]\{[^{}"\n]*\})[^"\\$%\n]*)*"
+                    |/(?![/*])
+                    |<(?!<-?[A-Za-z_])
+                )[^"{}\#/<]*)*
+            \}
+        )[^"{}\#/<]*)*
+        (?:(?P<template>")
+            |\#[^\n]*|//[^\n]*|/\*.*?\*/
+            |<<-?(?P<marker>[A-Za-z_][\w-]*)[ \t]*\r?\n
+            |(?P<open>\{)
+            |(?P<close>\})
+        )
+    ''', flags=re.VERBOSE | re.DOTALL)
+
+_KINDS = {
+    'newline': 'NEWLINE',
+    'string': 'STRING',
+    'simple_template': 'TEMPLATE',
+    'number': 'NUMBER',
+    'ident': 'IDENT',
+    'op': 'OP',
+    'eof': 'EOF',
+}
+
+_OPENERS = { '{': '}', '[': ']', '(': ')' }
+_CLOSERS = set(_OPENERS.values())
+
+def _line(text, pos):
+    return text.count('\n', 0, pos) + 1
+
+def _heredoc_end(text, match):
+    marker = re.compile(r'^[ \t]*%s[ \t]*$' % re.escape(match.group('marker')), flags=re.MULTILINE)
+    end = marker.search(text, match.end())
+    if end is None:
+        raise HCLSyntaxError(f'unterminated heredoc on line {_line(text, match.start())}')
+    return end
+
+def _heredoc_value(text, match, end):
+    lines = text[match.end():end.start()].splitlines(keepends=True)
+    if match.group('indent'):
+        indents = [ len(l) - len(l.lstrip(' \t')) for l in lines if l.strip() ]
+        strip = min(indents, default=0)
+        lines = [ l[strip:] for l in lines ]
+    return ''.join(lines)
+
+class Lexer:
+    def __init__(self, text, pos=0):
+        self._text = text
+        self.pos = pos
+
+    def _error(self, msg, pos=None):
+        pos = self.pos if pos is None else pos
+        return HCLSyntaxError(f'{msg} on line {_line(self._text, pos)}')
+
+    # Returns the end of the ${ } or %{ } sequence starting at pos
+    def _interpolation_end(self, pos):
+        lexer = Lexer(self._text, pos)
+        depth = 1
+        while True:
+            token = lexer.next()
+            if token.kind == 'EOF':
+                raise self._error('unterminated template interpolation', pos)
+            if token.kind == 'OP' and token.value == '{':
+                depth += 1
+            elif token.kind == 'OP' and token.value == '}':
+                depth -= 1
+                if not depth:
+                    return token.end
+
+    def _template_end(self, pos):
+        start = pos
+        pos += 1
+        while True:
+            match = Patterns.template_part.match(self._text, pos)
+            if match is None:
+                raise self._error('unterminated string', start)
+            part = match.group()
+            if part == '"':
+                return match.end()
+            if part in ('${', '%{'):
+                pos = self._interpolation_end(match.end())
+                continue
+            pos = match.end()
+
+    def next(self):
+        text = self._text
+        match = Patterns.token.match(text, self.pos)
+        kind = match.lastgroup
+        start, end = match.span(kind)
+        if kind == 'invalid':
+            raise self._error(f'unexpected character {match.group(kind)!r}', start)
+        if kind == 'heredoc':
+            terminator = _heredoc_end(text, match)
+            self.pos = terminator.end()
+            return Token('HEREDOC', _heredoc_value(text, match, terminator), start, self.pos)
+        if kind == 'template':
+            self.pos = self._template_end(start)
+            return Token('TEMPLATE', text[start:self.pos], start, self.pos)
+        self.pos = end
+        return Token(_KINDS[kind], match.group(kind), start, end)
+
+    # Jumps past the end of a block body whose opening brace was just read
+    def skip_block(self):
+        text = self._text
+        depth = 1
+        while True:
+            match = Patterns.skip.match(text, self.pos)
+            if match is None:
+                raise self._error('unterminated block')
+            kind = match.lastgroup
+            if kind == 'close':
+                depth -= 1
+                self.pos = match.end()
+                if not depth:
+                    return
+            elif kind == 'open':
+                depth += 1
+                self.pos = match.end()
+            elif kind == 'template':
+                self.pos = self._template_end(match.start('template'))
+            elif kind == 'marker':
+                self.pos = _heredoc_end(text, match).end()
+            else:
+                self.pos = match.end()
+
+def tokenize(text):
+    lexer = Lexer(text)
+    while True:
+        token = lexer.next()
+        if token.kind == 'EOF':
+            return
+        yield token
+
+class NotLiteralError(ValueError):
+    pass
+
+def _unquote(token):
+    # $${ and %%{ are HCL's escapes for a literal ${ and %{
+    return json.loads(token.value, strict=False).replace('$${', '${').replace('%%{', '%{')
+
+def _unquote_label(label):
+    if not label.startswith('"'):
+        return label
+    return json.loads(label) if '\\' in label else label[1:-1]
+
+class _Evaluator:
+    def __init__(self, tokens):
+        self._tokens = [ t for t in tokens if t.kind != 'NEWLINE' ]
+        self._pos = 0
+
+    def _next(self):
+        if self._pos >= len(self._tokens):
+            raise NotLiteralError('unexpected end of expression')
+        token = self._tokens[self._pos]
+        self._pos += 1
+        return token
+
+    def _peek(self, value):
+        return self._pos < len(self._tokens) and self._tokens[self._pos].value == value and self._tokens[self._pos].kind == 'OP'
+
+    def _sequence(self, closer, item):
+        values = []
+        while not self._peek(closer):
+            values.append(item())
+            if self._peek(','):
+                self._pos += 1
+        self._pos += 1
+        return values
+
+    def _entry(self):
+        key = self._next()
+        if key.kind == 'STRING':
+            name = _unquote(key)
+        elif key.kind == 'IDENT':
+            name = key.value
+        else:
+            raise NotLiteralError(key.value)
+        separator = self._next()
+        if separator.value not in ('=', ':'):
+            raise NotLiteralError(separator.value)
+        return name, self.value()
+
+    def value(self):
+        token = self._next()
+        if token.kind == 'STRING':
+            return _unquote(token)
+        if token.kind == 'HEREDOC':
+            return token.value
+        if token.kind == 'NUMBER':
+            return float(token.value) if any(c in token.value for c in '.eE') else int(token.value)
+        if token.kind == 'IDENT' and token.value in ('true', 'false', 'null'):
+            return { 'true': True, 'false': False, 'null': None }[token.value]
+        if token.kind == 'OP' and token.value == '-':
+            number = self.value()
+            if isinstance(number, bool) or not isinstance(number, (int, float)):
+                raise NotLiteralError(token.value)
+            return -number
+        if token.kind == 'OP' and token.value == '[':
+            return self._sequence(']', self.value)
+        if token.kind == 'OP' and token.value == '{':
+            return dict(self._sequence('}', self._entry))
+        raise NotLiteralError(token.value)
+
+    def evaluate(self):
+        value = self.value()
+        if self._pos != len(self._tokens):
+            raise NotLiteralError(self._tokens[self._pos].value)
+        return value
+
+class Attribute:
+    def __init__(self, name, expr, tokens):
+        self.name = name
+        self.expr = expr
+        self.tokens = tokens
+
+    # The attribute's value if it is a literal, otherwise NotLiteralError
+    @property
+    def value(self):
+        return _Evaluator(self.tokens).evaluate()
+
+    def literal(self, default=None):
+        try:
+            return self.value
+        except NotLiteralError:
+            return default
+
+    def __repr__(self):
+        return f'<Attribute: {self.name} = {self.expr}>'
+
+# A block's body is only parsed the first time it is looked at
+class Block:
+    def __init__(self, type, labels, text, start, end):
+        self.type = type
+        self.labels = labels
+        self._text = text
+        self._start = start
+        self._end = end
+        self._body = None
+
+    # The body as written, without its closing brace
+    @property
+    def source(self):
+        return self._text[self._start:self._end - 1]
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = _Parser(self._text, pos=self._start).body()
+        return self._body
+
+    def __repr__(self):
+        return f'<Block: {self.type} {" ".join(self.labels)}>'
+
+class Body:
+    def __init__(self, attributes, blocks):
+        self.attributes = attributes
+        self.blocks = blocks
+
+    def blocks_of(self, block_type):
+        return [ b for b in self.blocks if b.type == block_type ]
+
+class _Parser:
+    def __init__(self, text, block_types=None, pos=0):
+        self._text = text
+        self._lexer = Lexer(text, pos)
+        self._block_types = block_types
+        self._peeked = None
+
+    def _next(self):
+        if self._peeked is not None:
+            token, self._peeked = self._peeked, None
+            return token
+        return self._lexer.next()
+
+    def _peek(self):
+        if self._peeked is None:
+            self._peeked = self._lexer.next()
+        return self._peeked
+
+    def _error(self, token, msg):
+        return HCLSyntaxError(f'{msg} on line {_line(self._text, token.start)}')
+
+    def _expression(self, name):
+        tokens = []
+        closers = []
+        while True:
+            token = self._peek()
+            if token.kind == 'EOF':
+                break
+            if not closers and (token.kind == 'NEWLINE' or (token.kind == 'OP' and token.value == '}')):
+                break
+            self._next()
+            if token.kind == 'OP' and token.value in _OPENERS:
+                closers.append(_OPENERS[token.value])
+            elif token.kind == 'OP' and token.value in _CLOSERS:
+                if not closers or closers.pop() != token.value:
+                    raise self._error(token, f'unbalanced {token.value!r}')
+            tokens.append(token)
+        if closers or not tokens:
+            raise self._error(token, f'incomplete expression for {name}')
+        return Attribute(name, self._text[tokens[0].start:tokens[-1].end], tokens)
+
+    def _labels(self):
+        labels = []
+        while True:
+            token = self._next()
+            if token.kind == 'OP' and token.value == '{':
+                return labels
+            if token.kind == 'STRING':
+                labels.append(_unquote(token))
+            elif token.kind == 'IDENT':
+                labels.append(token.value)
+            else:
+                raise self._error(token, 'expected a block label or {')
+
+    def _block(self, header, top_level):
+        block_type = header.group('type')
+        self._lexer.pos = header.end()
+        self._lexer.skip_block()
+        if top_level and self._block_types is not None and block_type not in self._block_types:
+            return None
+        labels = tuple( _unquote_label(l) for l in Patterns.label.findall(header.group('labels')) )
+        return Block(block_type, labels, self._text, header.end(), self._lexer.pos)
+
+    # Yields the attributes and blocks of a body until its closing brace
+    def items(self, top_level=False):
+        while True:
+            header = None if self._peeked is not None else Patterns.header.match(self._text, self._lexer.pos)
+            if header is not None:
+                block = self._block(header, top_level)
+                if block is not None:
+                    yield block
+                continue
+            token = self._next()
+            if token.kind == 'NEWLINE':
+                continue
+            if token.kind == 'EOF':
+                if not top_level:
+                    raise self._error(token, 'unexpected end of file')
+                return
+            if token.kind == 'OP' and token.value == '}' and not top_level:
+                return
+            if token.kind != 'IDENT':
+                raise self._error(token, f'unexpected {token.value!r}')
+            following = self._peek()
+            if following.kind == 'OP' and following.value == '=':
+                self._next()
+                yield self._expression(token.value)
+                continue
+            labels = self._labels()
+            start = self._lexer.pos
+            self._lexer.skip_block()
+            if top_level and self._block_types is not None and token.value not in self._block_types:
+                continue
+            yield Block(token.value, tuple(labels), self._text, start, self._lexer.pos)
+
+    def body(self):
+        attributes = {}
+        blocks = []
+        for item in self.items():
+            if isinstance(item, Block):
+                blocks.append(item)
+            else:
+                attributes[item.name] = item
+        return Body(attributes, blocks)
+
+# Yields the top-level attributes and blocks of an HCL document as they are parsed.
+# When block_types is given, any other top-level block is skipped over.
+def parse(text, block_types=None):
+    return _Parser(text, block_types).items(top_level=True)
@@ -0,0 +1,87 @@
+import os
+from collections import defaultdict
+from threading import Lock
+from . import terraform
+from .parse import parse_terraform_output, parse_tfstate_outputs, read_tfstate
+from .util.proc import run as procrun
+from .util.log import Log
+from .util.store import JSONStore
+from .util.trace import tracer
+
+_log = Log('outputs')
+
+# Statefile format versions whose top-level outputs match `terraform output -json`
+_KNOWN_STATE_VERSIONS = [ 4 ]
+
+def _read_state(statefile):
+    state = read_tfstate(statefile, 'version', 'lineage', 'serial', 'outputs')
+    if not state or 'lineage' not in state or 'serial' not in state:
+        return None, None
+    version = state['lineage'], state['serial']
+    if state.get('version') not in _KNOWN_STATE_VERSIONS or 'outputs' not in state:
+        return version, None
+    return version, { v.name: v.value for v in parse_tfstate_outputs(state['outputs']) }
+
+def _state_stat(statefile):
+    try:
+        stat = os.stat(statefile)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# Resolves each module's outputs at most once per change of its statefile.
+# Outputs are read straight from statefiles hab understands, anything else
+# goes through `terraform output` and is persisted keyed by the statefile's
+# lineage and serial so unchanged modules are reused next run.
+class OutputStore(JSONStore):
+    _description = 'output cache'
+    # Outputs can be sensitive, keep them as private as the statefiles
+    _mode = 0o600
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._resolved = {}
+        self._module_locks = defaultdict(Lock)
+
+    def _from_cache(self, module, version):
+        with self._lock:
+            cached = self._data.get(module.name)
+        if version is not None and cached and [cached['lineage'], cached['serial']] == list(version):
+            _log.debug(f'Reusing cached outputs of {module.name}')
+            return cached['outputs']
+
+    def _store(self, module, version, outputs):
+        if version is None:
+            return
+        with self._lock:
+            self._data[module.name] = dict(lineage=version[0], serial=version[1], outputs=outputs)
+            self._save()
+
+    def _resolve(self, module):
+        version, outputs = _read_state(module.statefile)
+        if outputs is not None:
+            _log.debug(f'Read outputs of {module.name} from {module.statefile}')
+            return outputs
+        outputs = self._from_cache(module, version)
+        if outputs is not None:
+            return outputs
+        _log.debug(f'Resolving outputs of {module.name} with terraform')
+        cmd = terraform.output(state=module.statefile, json=True)
+        retcode, stdout, _ = procrun(cmd, cwd=module.path, prefix=module.name)
+        if retcode != 0:
+            return None
+        outputs = { v.name: v.value for v in parse_terraform_output(stdout) }
+        self._store(module, version, outputs)
+        return outputs
+
+    def get(self, module):
+        with self._module_locks[module.name]:
+            stat = _state_stat(module.statefile)
+            resolved = self._resolved.get(module.name)
+            if resolved is not None and resolved[0] == stat:
+                return resolved[1]
+            with tracer.span('resolve outputs', module=module.name):
+                outputs = self._resolve(module)
+            if outputs is not None:
+                self._resolved[module.name] = (stat, outputs)
+            return outputs
@@ -1,4 +1,5 @@
 import re
+import mmap
 from .util.decs import as_list
 from enum import Enum
 from collections import namedtuple
@@ -9,11 +10,19 @@ import jsonschema
 from jsonschema.exceptions import ValidationError
 from pathlib import PosixPath
 from .habfile import load_habfile
+from . import hcl
+from .error import HCLSyntaxError
+from .util.log import Log
+
+_log = Log('parse')
 
 HABFILE_SCHEMA_PATH = f'{ PosixPath(__file__).resolve().parent / "habfile.json" }'
 with open(HABFILE_SCHEMA_PATH) as f:
     HABFILE_SCHEMA  = json.load(f)
 
+# The libyaml loader is several times faster where PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 class TFVarType(Enum):
     INPUT = 1
     OUTPUT = 2
@@ -28,6 +37,9 @@ Habitat = namedtuple('Habitat', ['name', 'biomes'] )
 Biome = namedtuple('Biome', ['name', 'modules'])
 Module = namedtuple('Module', ['name', 'should_destroy', 'before', 'after', 'provides', 'depends_on'])
 Script = namedtuple('Script', ['name', 'path'])
+ProviderRequirement = namedtuple('ProviderRequirement', ['name', 'source', 'version'])
+ModuleCall = namedtuple('ModuleCall', ['name', 'source', 'version'])
+Backend = namedtuple('Backend', ['type', 'config'])
 ModuleScript = namedtuple('ModuleScript', ['name', 'args', 'args_from'])
 ModuleScriptArg = namedtuple('ModuleScriptArg', ['name', 'module'])
 
@@ -35,11 +47,13 @@ TFVar = namedtuple('TFVar', [
         'name',
         'var_type',
         'value',
-        'sensitive'
+        'sensitive',
+        'tf_type'
     ],
     defaults=[
         None,
-        False
+        False,
+        None
     ])
 
 TYPE_MAPPINGS = {
@@ -48,44 +62,17 @@ TYPE_MAPPINGS = {
     'list(string)': str
 }
 
-QUOTES = ['"', "'"]
-def _has_quotes(line):
-    start = line[0]
-    end = line[-1]
-    return start in QUOTES and end in QUOTES and start == end
-
-def _strip_quotes(line):
-    if _has_quotes(line):
-        return line[1:-1]
-    return line
-
-# Tries to guess the type (string/int) of a tfvar value
-# Returns a function to coerce the given value to its type
-def _guess_type(value):
-    if _has_quotes(value):
-        return lambda x: str(_strip_quotes(x))
-    try:
-        int(value)
-    except ValueError:
-        return str
-    return int
-
 # Converts a dictionary to a namedtuple with matching keys
 def _to_namedtuple(name, dikt):
     dikt_type = namedtuple(name, dikt.keys())
     return dikt_type(**dikt)
 
-class Patterns:
-    tf_input_var_block = re.compile(r'^variable\s+"(?P<name>\w+)"\s+{\n(?P<conf>(?:[\t ]*\w+[\t ]*=[\t ]*[\S\t ]+\n)+)^}', flags=re.MULTILINE)
-    tf_output_var_block = re.compile(r'^output\s+"(?P<name>\w+)"\s+{\n(?P<conf>(?:[\t ]*\w+[\t ]*=[\t ]*[\S\t ]+\n)+)^}', flags=re.MULTILINE)
-    tf_block_values = re.compile(r'^[\t ]*(?P<key>\w+)[\t ]*=[\t ]*(?P<value>[\S\t ]+)[\t ]*$', flags=re.MULTILINE)
-    tfvar_value = re.compile(r'^(?P<key>[\w_-]+)[\t ]+=[\t ]+(?P<value>[\S\t ]+)$', flags=re.MULTILINE)
-
 @as_list
 def parse_tfvars(text):
-    for tfvar in Patterns.tfvar_value.finditer(text):
-        value = tfvar.group('value')
-        yield TFVar(name=tfvar.group('key'), value=_guess_type(value)(value), var_type=TFVarType.CONFIG)
+    for attribute in hcl.parse(text, block_types=()):
+        # Anything that isn't a literal is passed through as written
+        value = attribute.literal(default=attribute.expr)
+        yield TFVar(name=attribute.name, value=value, var_type=TFVarType.CONFIG)
 
 def parse_tfvars_json(text):
     data = json.loads(text)
@@ -98,22 +85,162 @@ def parse_terraform_output(text):
     for key, info in data.items():
         yield TFVar(name=key, var_type=info['type'], value=info['value'], sensitive=info['sensitive'])
 
+class StatePatterns:
+    whitespace = re.compile(rb'[ \t\n\r]*')
+    string = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+    scalar = re.compile(rb'[^,}\]\s]+')
+    token = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|([{\[])|([}\]])')
+
+def _skip_ws(buf, pos):
+    return StatePatterns.whitespace.match(buf, pos).end()
+
+# Returns the offset just past the JSON value starting at pos, without decoding it
+def _skip_json_value(buf, pos):
+    start = buf[pos:pos + 1]
+    if start == b'"':
+        return StatePatterns.string.match(buf, pos).end()
+    if start not in (b'{', b'['):
+        return StatePatterns.scalar.match(buf, pos).end()
+    depth = 0
+    for token in StatePatterns.token.finditer(buf, pos):
+        # Group 1 opens a container, group 2 closes one, strings match neither
+        if token.lastindex == 1:
+            depth += 1
+        elif token.lastindex == 2:
+            depth -= 1
+            if not depth:
+                return token.end()
+    raise ValueError('Unterminated JSON value')
+
+def _read_json_keys(buf, keys):
+    found = {}
+    pos = _skip_ws(buf, 0)
+    if buf[pos:pos + 1] != b'{':
+        raise ValueError('Expected a JSON object')
+    pos = _skip_ws(buf, pos + 1)
+    while buf[pos:pos + 1] == b'"' and len(found) < len(keys):
+        end = StatePatterns.string.match(buf, pos).end()
+        key = json.loads(buf[pos:end])
+        pos = _skip_ws(buf, end)
+        if buf[pos:pos + 1] != b':':
+            raise ValueError('Expected a key separator')
+        pos = _skip_ws(buf, pos + 1)
+        end = _skip_json_value(buf, pos)
+        if key in keys:
+            found[key] = json.loads(buf[pos:end])
+        pos = _skip_ws(buf, end)
+        if buf[pos:pos + 1] == b',':
+            pos = _skip_ws(buf, pos + 1)
+    return found
+
+# Reads only the requested top-level keys of a statefile.
+# The file is memory mapped and skipped over rather than decoded,
+# terraform writes outputs ahead of resources so large states stay cheap.
+def read_tfstate(path, *keys):
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                return _read_json_keys(buf, keys)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+@as_list
+def parse_tfstate_outputs(outputs):
+    for key, info in outputs.items():
+        yield TFVar(name=key, var_type=info.get('type'), value=info['value'], sensitive=info.get('sensitive', False))
+
+# Top-level blocks of the given types, with exactly `labels` labels unless it is None
+def _parse_tf_blocks(text, *block_types, labels=1):
+    try:
+        for block in hcl.parse(text, block_types=block_types):
+            if isinstance(block, hcl.Block) and (labels is None or len(block.labels) == labels):
+                yield block
+    except HCLSyntaxError as e:
+        _log.warning(f'Skipping the rest of a file: {e}')
+
+def _tf_attribute(block, name, literal=True):
+    attribute = block.body.attributes.get(name)
+    if attribute is None:
+        return None
+    return attribute.literal() if literal else attribute.expr
+
+# Only reads block headers, for when just the names are needed
+def parse_tf_variable_names(text):
+    inputs = []
+    outputs = []
+    for block in _parse_tf_blocks(text, 'variable', 'output'):
+        (inputs if block.type == 'variable' else outputs).append(block.labels[0])
+    return inputs, outputs
+
 @as_list
 def parse_tf_input(text):
-    for tfvar in Patterns.tf_input_var_block.finditer(text):
-        yield TFVar(name=tfvar.group('name'), var_type=TFVarType.INPUT)
+    for block in _parse_tf_blocks(text, 'variable'):
+        yield TFVar(
+            name=block.labels[0],
+            var_type=TFVarType.INPUT,
+            value=_tf_attribute(block, 'default'),
+            sensitive=_tf_attribute(block, 'sensitive') is True,
+            tf_type=_tf_attribute(block, 'type', literal=False)
+        )
 
 @as_list
 def parse_tf_output(text):
-    for tfvar in Patterns.tf_output_var_block.finditer(text):
-        varconf = dict(name=tfvar.group('name'), var_type=TFVarType.OUTPUT)
-        for value in Patterns.tf_block_values.finditer(tfvar.group('conf')):
-            if value.group('key') == 'sensitive':
-                varconf['sensitive'] = value.group('value') == 'true'
-        yield TFVar(**varconf)
+    for block in _parse_tf_blocks(text, 'output'):
+        yield TFVar(
+            name=block.labels[0],
+            var_type=TFVarType.OUTPUT,
+            sensitive=_tf_attribute(block, 'sensitive') is True
+        )
+
+# Providers a module needs, from terraform { required_providers {} } and from
+# provider blocks, which is how modules written before terraform 0.13 declare them
+@as_list
+def _required_providers(blocks):
+    for block in blocks:
+        if block.type == 'provider' and len(block.labels) == 1:
+            yield ProviderRequirement(block.labels[0], None, _tf_attribute(block, 'version'))
+        if block.type != 'terraform':
+            continue
+        for required in block.body.blocks_of('required_providers'):
+            for name, attribute in required.body.attributes.items():
+                value = attribute.literal()
+                if isinstance(value, dict):
+                    yield ProviderRequirement(name, value.get('source'), value.get('version'))
+                else:
+                    yield ProviderRequirement(name, None, value if isinstance(value, str) else None)
+
+# Module blocks and the source each one is installed from
+@as_list
+def _module_calls(blocks):
+    for block in blocks:
+        if block.type == 'module' and len(block.labels) == 1:
+            yield ModuleCall(block.labels[0], _tf_attribute(block, 'source', literal=False), _tf_attribute(block, 'version', literal=False))
+
+# The backend configuration as written, terraform only reads it during init
+@as_list
+def _backends(blocks):
+    for block in blocks:
+        if block.type != 'terraform':
+            continue
+        for backend in block.body.blocks_of('backend'):
+            yield Backend(backend.labels[0] if backend.labels else None, backend.source)
+
+def parse_tf_required_providers(text):
+    return _required_providers(_parse_tf_blocks(text, 'terraform', 'provider', labels=None))
+
+def parse_tf_module_calls(text):
+    return _module_calls(_parse_tf_blocks(text, 'module'))
+
+def parse_tf_backends(text):
+    return _backends(_parse_tf_blocks(text, 'terraform', labels=None))
+
+# Everything terraform init acts on, the providers, module calls and backends, from one pass over text
+def parse_tf_init_config(text):
+    blocks = list(_parse_tf_blocks(text, 'terraform', 'provider', 'module', labels=None))
+    return _required_providers(blocks), _module_calls(blocks), _backends(blocks)
 
 def parse_habfile(text):
-    data =  yaml.load(text)
+    data = yaml.load(text, Loader=_YAML_LOADER)
     try:
         jsonschema.validate(instance=data, schema=HABFILE_SCHEMA)
     except ValidationError as e:
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+from tempfile import TemporaryDirectory
+from . import terraform
+from .parse import parse_tf_required_providers
+from .util.proc import run as procrun
+from .util.log import Log
+from .util.trace import traced
+
+_log = Log('plugins')
+
+# Namespace terraform assumes for providers declared without a source
+_DEFAULT_NAMESPACE = 'hashicorp'
+# Remembers which requirements the cache was last warmed for
+_WARMED_MARKER = '.hab-warmed'
+
+def _module_requirements(module):
+    requirements = []
+    for tf_file in module.tf_files:
+        with open(tf_file) as f:
+            requirements.extend(parse_tf_required_providers(f.read()))
+    sources = { r.name: r.source for r in requirements if r.source }
+    constraints = defaultdict(list)
+    for requirement in requirements:
+        versions = constraints[sources.get(requirement.name, f'{_DEFAULT_NAMESPACE}/{requirement.name}')]
+        if requirement.version and requirement.version not in versions:
+            versions.append(requirement.version)
+    # Terraform intersects every constraint a module places on a provider
+    return { source: ', '.join(versions) or None for source, versions in constraints.items() }
+
+# Each provider's distinct constraints across all modules, in the order they were found.
+# Constraints from different modules may not be satisfiable together, so they are never merged.
+def _collect_requirements(modules):
+    requirements = defaultdict(list)
+    for module in modules:
+        for source, version in _module_requirements(module).items():
+            if version not in requirements[source]:
+                requirements[source].append(version)
+    for versions in requirements.values():
+        if len(versions) > 1 and None in versions:
+            versions.remove(None)
+    return dict(sorted(requirements.items()))
+
+# Splits the requirements into configurations terraform can init,
+# the nth configuration asks for the nth constraint of every provider
+def _build_configs(requirements):
+    rounds = max((len(v) for v in requirements.values()), default=0)
+    for i in range(rounds):
+        providers = {}
+        for source, versions in requirements.items():
+            if i >= len(versions):
+                continue
+            # Local names only need to be unique, the source decides what gets installed
+            name = f'p{len(providers)}_{source.rsplit("/", 1)[-1]}'
+            providers[name] = dict(source=source)
+            if versions[i] is not None:
+                providers[name]['version'] = versions[i]
+        yield { 'terraform': { 'required_providers': providers } }
+
+# A provider plugin cache shared by every module. Terraform doesn't coordinate concurrent
+# writes to the cache, so it is filled once up front and module inits only link from it.
+class PluginCache:
+    def __init__(self, path):
+        self._path = path
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._warmed = set()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def environ(self):
+        return { 'TF_PLUGIN_CACHE_DIR': str(self._path) }
+
+    def _is_warm(self, digest):
+        try:
+            return (self._path / _WARMED_MARKER).read_text() == digest
+        except OSError:
+            return False
+
+    def _init(self, config):
+        with TemporaryDirectory(prefix='hab-plugins-') as workdir:
+            with open(os.path.join(workdir, 'main.tf.json'), 'w') as f:
+                json.dump(config, f)
+            cmd = terraform.init(backend=False, input=False)
+            retcode, _, _ = procrun(cmd, cwd=workdir, prefix='plugins', env={ **os.environ, **self.environ })
+        return retcode == 0
+
+    @traced('prewarm plugin cache')
+    def prewarm(self, modules):
+        requirements = _collect_requirements(modules)
+        if not requirements:
+            return True
+        digest = hashlib.sha256(json.dumps(requirements).encode()).hexdigest()
+        if digest in self._warmed or self._is_warm(digest):
+            return True
+        _log.debug(f'Warming plugin cache for { " ".join(requirements) }')
+        success = all([ self._init(config) for config in _build_configs(requirements) ])
+        if success:
+            (self._path / _WARMED_MARKER).write_text(digest)
+            self._warmed.add(digest)
+        else:
+            _log.warning('Failed to warm the plugin cache, modules will install their own providers')
+        return success
@@ -1,38 +1,39 @@
 import concurrent.futures
-from .util.decs import as_list
+import os
+import time
+from .util.events import events
 from .util.log import Log
+from .util.trace import tracer
 
 _log = Log('runner')
 
-class Action:
-    def __init__(self,  stage, command):
-        self._stage = stage
-        self._command = command
-
-    def execute(self, executor):
-        _log.debug(f'Executing {self._command} in {self._stage}')
-        tasks = self._stage.execute(executor, self._command)
-        results = concurrent.futures.wait(tasks.keys())
-        success = all(map(lambda f: f.result()[0], results.done))
-        failures = []
-        if not success:
-            failures = [ tasks[t] for t in filter(lambda t: not t.result()[0], results.done) ]
-        return success, failures
+# Commands that modify infrastructure, summarized by how many modules they touched
+_CHANGING_COMMANDS = [ 'apply', 'destroy' ]
 
 class Runner:
-    def __init__(self, stages, max_workers=None):
-        self._stages = stages
-        self._max_workers = max_workers if max_workers is not None else len(stages) + 5
+    def __init__(self, schedule, max_workers=None):
+        self._schedule = schedule
+        self._max_workers = max_workers if max_workers is not None else os.cpu_count() or 1
 
-    def _build_actions(self, command):
-        for stage in self._stages:
-            yield Action(stage, command)
+    # Options are passed on to every target, see execute_target
+    def execute(self, command, **options):
+        _log.debug(f'Executing {command} with {self._max_workers} workers')
+        events.emit('run_started', command=command, targets=[ t.name for t in self._schedule.targets ], jobs=self._max_workers)
+        started = time.monotonic()
+        with tracer.span(command, 'run'), concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='hab-worker') as executor:
+            success, failures = self._schedule.execute(executor, command, self._max_workers, **options)
+        if not success:
+            _log.error(f'Modules { " ".join(failures) } failed to {command}')
+        if command in _CHANGING_COMMANDS:
+            self._summarize(command)
+        changed = [ t.name for t in self._schedule.targets if t.changed ]
+        events.emit('run_finished', command=command, success=success, failures=failures, changed=changed, duration=time.monotonic() - started)
+        return success
 
-    def execute(self, command):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            for action in self._build_actions(command):
-                success, failures = action.execute(executor)
-                if not success:
-                    _log.error(f'Modules { " ".join(failures) } failed to {command}')
-                    return False
-        return True
+    def _summarize(self, command):
+        targets = self._schedule.targets
+        changed = [ t.name for t in targets if t.changed ]
+        unchanged = len(targets) - len(changed)
+        _log.info(f'{command.capitalize()} changed {len(changed)} of {len(targets)} modules, {unchanged} left untouched')
+        if changed:
+            _log.info(f'Changed modules: { " ".join(changed) }')
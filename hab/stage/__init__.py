@@ -1,4 +1,4 @@
-from .stage import Stage
 from .target import Target
-from .build import build_stages
+from .schedule import Schedule
+from .build import build_schedule
 # from .waiter import Waiter
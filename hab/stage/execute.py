@@ -0,0 +1,60 @@
+import time
+from ..util.console import console
+from ..util.events import events
+from ..util.log import Log
+from ..util.trace import tracer
+
+_log = Log('stage.execute')
+
+_TARGET_CMD_DEPS = {
+    'init': [],
+    'validate': [ 'init' ],
+    'plan': [ 'init', 'validate' ],
+    'apply': [ 'init', 'validate', 'plan', 'before' ],
+    'output': [ 'init', 'validate', 'plan', 'apply' ],
+    'destroy': [],
+    'clean': [],
+    'fclean': [ 'clean' ],
+}
+
+_TARGET_CMD_FINISH = {
+    'destroy': [ 'after' ]
+}
+
+# Commands a target can skip when nothing it depends on has changed since it last ran
+_TARGET_CMD_INCREMENTAL = [ 'apply' ]
+
+# The phases execute_target runs a command through, in order
+def command_phases(command):
+    return _TARGET_CMD_DEPS.get(command, []) + [ command ]
+
+def _execute_target(target, command, tfvars, force, reinit):
+    if reinit:
+        target.reinit()
+    if command in _TARGET_CMD_INCREMENTAL and not force and target.unchanged(tfvars):
+        console.status(target.name, f'unchanged since its last {command}, skipping')
+        events.emit('target_skipped', target=target.name, command=command, reason='unchanged')
+        return True, ''
+    for dep in _TARGET_CMD_DEPS.get(command):
+        success, _ = getattr(target, dep)(tfvars)
+        if not success:
+            return False, ''
+    success, stdout = getattr(target, command)(tfvars)
+    if not success or command not in _TARGET_CMD_FINISH:
+        return success, stdout
+    for finisher in _TARGET_CMD_FINISH.get(command):
+        _success, _ = getattr(target, finisher)(tfvars)
+        if not _success:
+            return False, ''
+    return success, stdout
+
+def execute_target(target, command, tfvars, force=False, reinit=False):
+    events.emit('target_started', target=target.name, command=command)
+    started = time.monotonic()
+    success = False
+    try:
+        with tracer.span(target.name, 'target', command=command):
+            success, stdout = _execute_target(target, command, tfvars, force, reinit)
+        return success, stdout
+    finally:
+        events.emit('target_finished', target=target.name, command=command, success=success, changed=target.changed, duration=time.monotonic() - started)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import PosixPath
+from ..parse import parse_tf_init_config, read_tfstate
+from ..util.log import Log
+from ..util.store import JSONStore
+
+_log = Log('stage.fingerprints')
+
+_CHUNK_SIZE = 1 << 16
+_LOCK_FILE = '.terraform.lock.hcl'
+# Lives in the directory init populates, so removing that directory also forgets the init
+_INIT_MARKER = PosixPath('.terraform') / '.hab-init'
+# Where init installs providers, as links into the plugin cache when there is one
+_PROVIDERS_DIR = PosixPath('.terraform') / 'providers'
+
+# Hashes everything that goes into applying a module, its source tree and the inputs it is given.
+# Files are framed by their relative path and size so moving bytes between them changes the hash.
+def fingerprint(module, inputs):
+    digest = hashlib.sha256()
+    for path in module.source_files:
+        digest.update(f'{path.relative_to(module.path).as_posix()}\0{path.stat().st_size}\0'.encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    digest.update(json.dumps(inputs, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+# Identifies the terraform that would run without starting it, an upgrade replaces the file
+def _terraform_binary(environ):
+    path = shutil.which('terraform', path=(environ or os.environ).get('PATH'))
+    if path is None:
+        return ''
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}'
+
+# Hashes what terraform init acts on: provider requirements, module calls, the backend
+# configuration and the dependency lock file, along with the init command itself,
+# the terraform binary and the plugin cache it installs from
+def init_fingerprint(module, cmd, environ=None):
+    digest = hashlib.sha256(cmd.encode())
+    plugin_cache = (environ or os.environ).get('TF_PLUGIN_CACHE_DIR', '')
+    digest.update(f'\0{_terraform_binary(environ)}\0{plugin_cache}\0'.encode())
+    for tf_file in module.tf_files:
+        with open(tf_file) as f:
+            text = f.read()
+        config = list(parse_tf_init_config(text))
+        digest.update(json.dumps([ tf_file.relative_to(module.path).as_posix(), config ]).encode())
+    try:
+        digest.update((module.path / _LOCK_FILE).read_bytes())
+    except FileNotFoundError:
+        pass
+    return digest.hexdigest()
+
+# Whether every provider init installed is still there. Emptying the plugin
+# cache leaves the links to it dangling without changing anything else.
+def providers_installed(module):
+    for root, dirs, files in os.walk(module.path / _PROVIDERS_DIR):
+        for name in dirs + files:
+            if not os.path.exists(os.path.join(root, name)):
+                return False
+    return True
+
+def read_init_marker(module):
+    try:
+        return (module.path / _INIT_MARKER).read_text()
+    except OSError:
+        return None
+
+def write_init_marker(module, fingerprint):
+    try:
+        (module.path / _INIT_MARKER).write_text(fingerprint)
+    except OSError as e:
+        _log.warning(f'Unable to record the init of {module.name}: {e}')
+
+def clear_init_marker(module):
+    try:
+        (module.path / _INIT_MARKER).unlink()
+    except FileNotFoundError:
+        pass
+
+def _state_version(statefile):
+    state = read_tfstate(statefile, 'lineage', 'serial')
+    if not state or 'lineage' not in state or 'serial' not in state:
+        return None
+    return [ state['lineage'], state['serial'] ]
+
+# Remembers the fingerprint of each module's last successful apply along with
+# the statefile version it produced. A module is only considered unchanged while
+# its statefile is still the one hab wrote, anything else touching it forces a rerun.
+class FingerprintStore(JSONStore):
+    _description = 'fingerprints'
+
+    def matches(self, module, fingerprint):
+        with self._lock:
+            recorded = self._data.get(module.name)
+        if recorded is None or recorded['fingerprint'] != fingerprint:
+            return False
+        return recorded['state'] == _state_version(module.statefile)
+
+    def record(self, module, fingerprint):
+        version = _state_version(module.statefile)
+        with self._lock:
+            if version is None:
+                self._data.pop(module.name, None)
+            else:
+                self._data[module.name] = dict(fingerprint=fingerprint, state=version)
+                _log.debug(f'Recorded fingerprint {fingerprint[:12]} of {module.name}')
+            self._save()
+
+    def forget(self, module):
+        with self._lock:
+            if self._data.pop(module.name, None) is not None:
+                self._save()
@@ -1,23 +1,16 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from ..error import CircularDependencyError
 from ..util.decs import as_list
 from ..util.log import Log
 
 _log = Log('dependency')
 
-class CircularDependencyError(Exception):
-    pass
-
 class Node:
-    def __init__(self, id):
+    def __init__(self, id, rank=None):
         self.id = id
+        self.rank = rank
         self._dependencies = []
 
-    @property
-    def rank(self):
-        if self.dependencies:
-            return max(d.rank for d in self.dependencies) + 1
-        return 0
-
     def add_dependency(self, node):
         if node not in self._dependencies:
             self._dependencies.append(node)
@@ -35,7 +28,8 @@ class DependencyGraph:
         self._nodes = defaultdict(list)
 
     def _build_nodes(self):
-        nodes = { id: Node(id) for id in self._nodes.keys() }
+        ranks = self._rank_nodes()
+        nodes = { id: Node(id, ranks[id]) for id in self._nodes.keys() }
         for parent, node in nodes.items():
             for child in self._nodes[parent]:
                 node.add_dependency(nodes.get(child))
@@ -45,32 +39,87 @@ class DependencyGraph:
     def nodes(self):
         return self._build_nodes()
 
-    def _has_constaint(self, parent, child, deep=False, root=None):
-        if parent is root:
-            raise CircularDependencyError('%s can not be a dependency of %s!', parent, child)
-        if child in self._nodes[parent]:
-            return True
-        if not deep:
-            return False
-        root = root if root is not None else parent
-        for sub in self._nodes[parent]:
-            if self._has_constaint(sub, child, deep=deep, root=root):
-                return True
-        return False
+    def add_node(self, id):
+        if id not in self._nodes:
+            self._nodes[id] = []
+
+    def dependencies(self, id):
+        return list(self._nodes.get(id, []))
 
+    def _has_constaint(self, parent, child):
+        return child in self._nodes[parent]
+
+    # Cycles are only looked for once, when the graph is ranked
     def add_constraint(self, parent, child):
         _log.debug(f'Adding constraint {parent} -> {child}')
-        if not self._has_constaint(parent, child, deep=True):
+        if parent == child:
+            raise CircularDependencyError(f'{parent} -> {child}')
+        if not self._has_constaint(parent, child):
             self._nodes[parent].append(child)
             if child not in self._nodes:
                 self._nodes[child] = []
             return True
         return False
 
-    def _rank_nodes(self, nodes, lvl=0):
-        for node in nodes:
-            node.rank = lvl
-            self._rank_nodes(node.dependencies, lvl + 1)
+    def _dependents(self):
+        dependents = { id: [] for id in self._nodes.keys() }
+        for parent, children in self._nodes.items():
+            for child in children:
+                dependents[child].append(parent)
+        return dependents
+
+    # Kahn's algorithm, a node's rank is the length of the longest
+    # chain of dependencies beneath it
+    def _rank_nodes(self):
+        dependents = self._dependents()
+        remaining = { id: len(children) for id, children in self._nodes.items() }
+        ranks = { id: 0 for id in self._nodes.keys() }
+        queue = deque(id for id, count in remaining.items() if not count)
+        while queue:
+            id = queue.popleft()
+            for parent in dependents[id]:
+                ranks[parent] = max(ranks[parent], ranks[id] + 1)
+                remaining[parent] -= 1
+                if not remaining[parent]:
+                    queue.append(parent)
+        unranked = [ id for id, count in remaining.items() if count ]
+        if unranked:
+            raise CircularDependencyError(' -> '.join(self._find_cycle(unranked)))
+        return ranks
+
+    # Every node left over by Kahn's algorithm is on, or depends on, a cycle.
+    # Following any remaining dependency from one of them must eventually loop.
+    def _find_cycle(self, unranked):
+        remaining = set(unranked)
+        path = []
+        seen = {}
+        id = unranked[0]
+        while id not in seen:
+            seen[id] = len(path)
+            path.append(id)
+            id = next(c for c in self._nodes[id] if c in remaining)
+        return path[seen[id]:] + [ id ]
+
+    # Drops constraints already implied through another dependency.
+    # Reachability is kept as bitsets, built up from the lowest rank.
+    def reduce(self):
+        ranks = self._rank_nodes()
+        bits = { id: 1 << i for i, id in enumerate(self._nodes.keys()) }
+        reachable = {}
+        removed = 0
+        for id in sorted(self._nodes.keys(), key=lambda n: ranks[n]):
+            covered = 0
+            kept = set()
+            for child in sorted(self._nodes[id], key=lambda n: ranks[n], reverse=True):
+                if covered & bits[child]:
+                    removed += 1
+                    continue
+                kept.add(child)
+                covered |= bits[child] | reachable[child]
+            self._nodes[id] = [ c for c in self._nodes[id] if c in kept ]
+            reachable[id] = covered
+        _log.debug(f'Removed {removed} redundant constraints')
+        return removed
 
     def _build_layers(self, nodes):
         layers = defaultdict(list)
@@ -0,0 +1,26 @@
+from threading import Lock
+from ..util.log import Log
+
+_log = Log('stage.logs')
+
+# Hands out one log file per module for the full output of its terraform runs.
+# A module's log is started afresh the first time it is written to in a run.
+class LogStore:
+    def __init__(self, path, compress=False):
+        self._path = path
+        self._compress = compress
+        self._started = set()
+        self._lock = Lock()
+
+    def path(self, name):
+        suffix = '.log.gz' if self._compress else '.log'
+        path = self._path / f'{name}{suffix}'
+        with self._lock:
+            if name not in self._started:
+                self._path.mkdir(parents=True, exist_ok=True)
+                for stale in (self._path / f'{name}.log', self._path / f'{name}.log.gz'):
+                    if stale.exists():
+                        stale.unlink()
+                self._started.add(name)
+                _log.debug(f'Logging output of {name} to {path}')
+        return path
@@ -0,0 +1,109 @@
+import concurrent.futures
+import heapq
+from ..util.events import events
+from ..util.log import Log
+from ..util.trace import tracer
+from .execute import command_phases, execute_target
+
+_log = Log('schedule')
+
+# Starts each target as soon as all of its own dependencies have succeeded,
+# rather than waiting for every target in the previous stage to finish
+class Schedule:
+    def __init__(self, targets, dependencies, biome):
+        self._targets = targets
+        self._dependencies = dependencies
+        self._biome = biome
+
+    @property
+    def targets(self):
+        return self._targets
+
+    def dependencies(self, target):
+        return self._dependencies.get(target, set())
+
+    def _dependents(self):
+        dependents = { t: set() for t in self._targets }
+        for target in self._targets:
+            for dep in self.dependencies(target):
+                dependents[dep].add(target)
+        return dependents
+
+    def reversed(self):
+        return type(self)(list(reversed(self._targets)), self._dependents(), self._biome)
+
+    # Estimated time from starting a target until everything downstream of it is done.
+    # Targets are ordered dependencies first, so walking backwards sees dependents first.
+    def _critical_paths(self, command, dependents):
+        phases = command_phases(command)
+        timings = self._biome.env.timings
+        paths = {}
+        for target in reversed(self._targets):
+            downstream = max((paths.get(d, 0) for d in dependents[target]), default=0)
+            paths[target] = timings.estimate(target.name, *phases) + downstream
+        return paths
+
+    def _execute_target(self, target, command, options):
+        return execute_target(target, command, self._biome.input_plan(target), **options)
+
+    # Installs every provider the targets need once, before their inits run concurrently
+    def _prewarm(self, command):
+        if 'init' not in command_phases(command):
+            return
+        modules = { t.module.name: t.module for t in self._targets }
+        self._biome.env.plugin_cache.prewarm(modules.values())
+
+    def execute(self, executor, command, max_workers, **options):
+        self._prewarm(command)
+        dependents = self._dependents()
+        paths = self._critical_paths(command, dependents)
+        order = { t: i for i, t in enumerate(self._targets) }
+        waiting = { t: len(self.dependencies(t)) for t in self._targets }
+        ready = []
+        def push(target):
+            events.emit('target_ready', target=target.name, command=command, critical_path=paths[target])
+            heapq.heappush(ready, (-paths[target], order[target]))
+        for target in self._targets:
+            if not waiting[target]:
+                push(target)
+        running = {}
+        failures = []
+        finished = 0
+        while ready or running:
+            while not failures and ready and len(running) < max_workers:
+                _, i = heapq.heappop(ready)
+                target = self._targets[i]
+                _log.debug(f'Starting {command} of {target.name} (critical path {paths[target]:.1f}s)')
+                running[executor.submit(self._execute_target, target, command, options)] = target
+            if not running:
+                break
+            # Shows how many workers sat idle waiting on dependencies
+            tracer.counter('targets', running=len(running), ready=len(ready))
+            done, _ = concurrent.futures.wait(running.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                target = running.pop(future)
+                try:
+                    success, _ = future.result()
+                except Exception:
+                    _log.exception(f'Unhandled error during {command} of {target.name}')
+                    success = False
+                if not success:
+                    failures.append(target.name)
+                    continue
+                _log.debug(f'Finished {command} of {target.name}')
+                finished += 1
+                for dependent in dependents[target]:
+                    waiting[dependent] -= 1
+                    if not waiting[dependent]:
+                        push(dependent)
+        tracer.counter('targets', running=0, ready=len(ready))
+        if not failures and finished < len(self._targets):
+            stuck = [ t.name for t in self._targets if waiting[t] ]
+            _log.error(f'Modules { " ".join(stuck) } have unresolvable dependencies')
+            for name in stuck:
+                events.emit('target_blocked', target=name, command=command)
+            failures.extend(stuck)
+        return not failures, failures
+
+    def __repr__(self):
+        return f'<Schedule: { ", ".join(t.module.name for t in self._targets) }>'
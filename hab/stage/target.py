@@ -1,17 +1,43 @@
+import asyncio
+from functools import partial
 from uuid import uuid4
+from threading import Lock
+import os
+import time
 from ..tfvars import TempVarFile
+from .fingerprints import fingerprint, init_fingerprint, providers_installed, read_init_marker, write_init_marker, clear_init_marker
 from .. import terraform
-from ..util.proc import run as procrun
+from ..env.waiter import wait_all
+from ..util.proc import run as procrun, wait_for
+from ..util.console import console
+from ..util.events import events
+from ..util.trace import tracer
 from ..util.log import Log
 
 _log = Log('target')
 
+# With -detailed-exitcode plan exits 0 when there is nothing to change and 2 when there is
+_PLAN_NO_CHANGES = 0
+_PLAN_CHANGES = 2
+# Lines of each command's output kept in memory, the full output goes to the module's log
+_OUTPUT_TAIL = 100
+
 class Target:
-    def __init__(self, provides, module):
+    def __init__(self, provides, module, timings=None, fingerprints=None, plugin_cache=None, logs=None, flights=None):
         self.provides = provides
         self._module = module
+        self._timings = timings
+        self._fingerprints = fingerprints
+        self._logs = logs
+        self._flights = flights
+        self._environ = { **os.environ, **plugin_cache.environ } if plugin_cache is not None else None
+        self._planned = None
+        self._plan_changes = None
+        # Whether terraform actually modified the module's infrastructure
+        self.changed = False
         self.id = uuid4().hex
         self._results = dict()
+        self._lock = Lock()
 
     @property
     def module(self):
@@ -21,38 +47,115 @@ class Target:
     def name(self):
         return self._module.name
 
-    def _run(self, cmd):
-        if cmd not in self._results:
-            retcode, stdout = procrun(cmd, cwd=self.module.path)
-            self._results[cmd] = (retcode == 0, stdout)
-        return self._results[cmd]
+    # Only the tail of the output is kept unless the whole of it is needed
+    def _exec(self, cmd, phase=None, ok=(0,), capture=False):
+        with self._lock:
+            if cmd not in self._results:
+                logfile = self._logs.path(self.name) if self._logs is not None else None
+                if phase is not None:
+                    console.status(self.name, f'{phase} started')
+                    events.emit('phase_started', target=self.name, phase=phase)
+                started = time.monotonic()
+                with tracer.span(phase or 'command', 'phase', target=self.name):
+                    retcode, stdout, output = procrun(
+                            cmd,
+                            cwd=self.module.path,
+                            prefix=self.name,
+                            env=self._environ,
+                            tail=None if capture else _OUTPUT_TAIL,
+                            logfile=logfile
+                        )
+                duration = time.monotonic() - started
+                if phase is not None:
+                    events.emit('phase_finished', target=self.name, phase=phase, exit_code=retcode, success=retcode in ok, duration=duration)
+                if retcode in ok and phase is not None:
+                    console.status(self.name, f'{phase} finished in {duration:.1f}s')
+                    if self._timings is not None:
+                        self._timings.record(self.name, phase, duration)
+                if retcode not in ok:
+                    self._report_failure(phase or cmd, retcode, output, logfile)
+                self._results[cmd] = (retcode, stdout)
+            return self._results[cmd]
+
+    # output is the tail of both stdout and stderr, terraform reports its errors on the latter
+    def _report_failure(self, label, retcode, output, logfile):
+        console.status(self.name, f'{label} failed with exit code {retcode}')
+        # The output wasn't shown as it happened, so at least its end is
+        if console.quiet and output:
+            console.lines(self.name, output.splitlines(), always=True)
+        if logfile is not None:
+            console.status(self.name, f'full output in {logfile}')
+
+    def _run(self, cmd, phase=None, capture=False):
+        retcode, stdout = self._exec(cmd, phase, capture=capture)
+        return retcode == 0, stdout
+
+    def _fingerprint(self, tfvars):
+        return fingerprint(self._module, tfvars.collect(*self._module.input_variables))
+
+    # Whether the module's sources and inputs are the same as at its last successful apply
+    def unchanged(self, tfvars):
+        if self._fingerprints is None:
+            return False
+        return self._fingerprints.matches(self._module, self._fingerprint(tfvars))
+
+    # Makes the next init run even if the module looks initialised already
+    def reinit(self):
+        clear_init_marker(self._module)
 
     def init(self, tfvars, *args, **kwargs):
         cmd = terraform.init(*args, **kwargs)
-        return self._run(cmd)
+        if read_init_marker(self._module) == init_fingerprint(self._module, cmd, self._environ) and providers_installed(self._module):
+            _log.debug(f'{self.name} is already initialised, skipping init')
+            events.emit('phase_skipped', target=self.name, phase='init', reason='initialised')
+            return True, ''
+        success, stdout = self._run(cmd, 'init')
+        if success:
+            # Init may have written the lock file, so the fingerprint is taken again
+            write_init_marker(self._module, init_fingerprint(self._module, cmd, self._environ))
+        return success, stdout
 
     def validate(self, tfvars, *args, **kwargs):
         cmd = terraform.validate(*args, **kwargs)
-        return self._run(cmd)
+        return self._run(cmd, 'validate')
 
     def plan(self, tfvars, *args, **kwargs):
+        if self._fingerprints is not None:
+            self._planned = self._fingerprint(tfvars)
         with TempVarFile(tfvars, self._module.input_variables) as varfile:
-            cmd = terraform.plan(*args, state=self.module.statefile, out=self.module.planfile, var_file=varfile.name, **kwargs)
-            return self._run(cmd)
+            cmd = terraform.plan(*args, state=self.module.statefile, out=self.module.planfile, var_file=varfile.name, detailed_exitcode=True, **kwargs)
+            retcode, stdout = self._exec(cmd, 'plan', ok=(_PLAN_NO_CHANGES, _PLAN_CHANGES))
+        if retcode not in (_PLAN_NO_CHANGES, _PLAN_CHANGES):
+            return False, stdout
+        self._plan_changes = retcode == _PLAN_CHANGES
+        return True, stdout
 
     def apply(self, tfvars, *args, **kwargs):
-        cmd = terraform.apply(*args, self.module.planfile, state=self.module.statefile, **kwargs)
-        return self._run(cmd)
+        if self._plan_changes is False:
+            console.status(self.name, 'no changes planned, skipping apply')
+            events.emit('phase_skipped', target=self.name, phase='apply', reason='no changes planned')
+            success, stdout = True, ''
+        else:
+            cmd = terraform.apply(*args, self.module.planfile, state=self.module.statefile, **kwargs)
+            success, stdout = self._run(cmd, 'apply')
+            self.changed = success
+        if success and self._planned is not None:
+            self._fingerprints.record(self._module, self._planned)
+        return success, stdout
 
     def output(self, *args, **kwargs):
         cmd = terraform.output(*args[1:], state=self.module.statefile, json=True, **kwargs)
-        return self._run(cmd)
+        return self._run(cmd, capture=True)
 
     def destroy(self, tfvars, *args, **kwargs):
         if self._module.should_destroy:
             with TempVarFile(tfvars, self._module.input_variables) as varfile:
                 cmd = terraform.destroy(*args, state=self.module.statefile, var_file=varfile.name, auto_approve=True, **kwargs)
-                return self._run(cmd)
+                success, stdout = self._run(cmd, 'destroy')
+            self.changed = success
+            if success and self._fingerprints is not None:
+                self._fingerprints.forget(self._module)
+            return success, stdout
         return True, ''
 
     def clean(self, tfvars, *args, **kwargs):
@@ -63,18 +166,37 @@ class Target:
         cmd = terraform.fclean(self.module.path / '.terraform', self.module.statefile.with_suffix('.tfstate.backup'))
         return self._run(cmd)
 
+    async def _probe(self, phase, waiter, args):
+        started = time.monotonic()
+        try:
+            with tracer.async_span(waiter.name, 'waiter', target=self.name):
+                if self._flights is not None:
+                    success, attempts = await self._flights.wait(waiter, args, prefix=self.name)
+                else:
+                    success, attempts = await waiter.wait(args, prefix=self.name)
+        except asyncio.CancelledError:
+            events.emit('waiter_cancelled', target=self.name, phase=phase, waiter=waiter.name, duration=time.monotonic() - started)
+            raise
+        events.emit('waiter_finished', target=self.name, phase=phase, waiter=waiter.name, success=success, attempts=attempts, duration=time.monotonic() - started)
+        return success
+
+    # Runs the module's waiters in order, or all at once when they're independent,
+    # stopping at the first that fails
+    def _wait(self, phase, waiters, tfvars):
+        if not waiters:
+            return True, ''
+        events.emit('phase_started', target=self.name, phase=phase)
+        started = time.monotonic()
+        probes = [ partial(self._probe, phase, waiter, tfvars.collect(*waiter.args)) for waiter in waiters ]
+        with tracer.span(phase, 'phase', target=self.name):
+            success = wait_for(wait_all(probes, parallel=self._module.parallel_waiters))
+        if not success:
+            console.status(self.name, f'{phase} waiters failed')
+        events.emit('phase_finished', target=self.name, phase=phase, success=success, duration=time.monotonic() - started)
+        return success, ''
+
     def before(self, tfvars, *args, **kwargs):
-        for waiter in self._module.before:
-            _kwargs = tfvars.collect(*waiter.args)
-            success = waiter.execute(**_kwargs)
-            if not success:
-                return False, ''
-        return True, ''
+        return self._wait('before', self._module.before, tfvars)
 
     def after(self, tfvars, *args, **kwargs):
-        for waiter in self._module.after:
-            _kwargs = tfvars.collect(*waiter.args)
-            success = waiter.execute(**_kwargs)
-            if not success:
-                return False, ''
-        return True, ''
\ No newline at end of file
+        return self._wait('after', self._module.after, tfvars)
@@ -0,0 +1,44 @@
+from ..util.log import Log
+from ..util.store import JSONStore
+
+_log = Log('stage.timings')
+
+# Weight given to the newest sample when smoothing recorded durations
+_SMOOTHING = 0.5
+# Assumed duration of a phase no module has recorded yet
+_DEFAULT_DURATION = 1.0
+
+# Smoothed durations of each phase of each module. Recorded as phases finish
+# and written out once when the run is over, see save.
+class TimingStore(JSONStore):
+    _description = 'timings'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._defaults = None
+
+    def record(self, module, phase, duration):
+        with self._lock:
+            phases = self._data.setdefault(module, {})
+            last = phases.get(phase)
+            phases[phase] = duration if last is None else last + _SMOOTHING * (duration - last)
+            self._defaults = None
+            self._dirty = True
+            _log.debug(f'Recorded {phase} of {module} in {duration:.2f}s')
+
+    # The mean duration of each phase across modules, for modules that haven't recorded it
+    @property
+    def _phase_defaults(self):
+        if self._defaults is None:
+            samples = {}
+            for phases in self._data.values():
+                for phase, duration in phases.items():
+                    samples.setdefault(phase, []).append(duration)
+            self._defaults = { phase: sum(s) / len(s) for phase, s in samples.items() }
+        return self._defaults
+
+    def estimate(self, module, *phases):
+        with self._lock:
+            recorded = self._data.get(module, {})
+            defaults = self._phase_defaults
+            return sum(recorded[p] if p in recorded else defaults.get(p, _DEFAULT_DURATION) for p in phases)
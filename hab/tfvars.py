@@ -1,4 +1,5 @@
-from .parse import parse_tfvars, parse_tfvars_json, parse_terraform_output
+from .parse import parse_tfvars, parse_tfvars_json
+from .error import HCLSyntaxError, InvalidVarFileError
 from .util.decs import as_list
 from tempfile import NamedTemporaryFile
 import json
@@ -57,41 +58,41 @@ class FileBackedVarFile(BaseVarFile):
             loader = parse_tfvars_json
         elif path.suffix == '.tfvars':
             loader = parse_tfvars
-        return { v.name: v.value for v in loader(text) }
+        # Carrying on without the rest of a varfile would plan with the wrong values
+        try:
+            return { v.name: v.value for v in loader(text) }
+        except (HCLSyntaxError, json.JSONDecodeError) as e:
+            raise InvalidVarFileError(path, e) from e
 
     @classmethod
     def from_file(cls, path):
         return cls(path.name, **cls._load_file(path))
 
-class TargetBackedVarFile(BaseVarFile):
-    def __init__(self, target, **kwargs):
-        super().__init__(target.name, **kwargs)
-        self._target = target
-        self._resolved = False
+class ModuleBackedVarFile(BaseVarFile):
+    def __init__(self, module, outputs, **kwargs):
+        super().__init__(module.name, **kwargs)
+        self._module = module
+        self._outputs = outputs
 
     @as_list
     def _keys(self):
-        return self._target.module.output_variables
+        return self._module.output_variables
 
     @classmethod
-    def from_target(cls, target):
-        return cls(target)
+    def from_module(cls, module, outputs):
+        return cls(module, outputs)
 
     def resolve(self):
-        success, stdout = self._target.output()
-        if success:
-            data = parse_terraform_output(stdout)
-            self._tfvars = { v.name: v.value for v in  data }
-            self._resolved = True
+        resolved = self._outputs.get(self._module)
+        if resolved is not None:
+            self._tfvars = resolved
 
     def collect(self, *args):
-        if not self._resolved:
-            self.resolve()
+        self.resolve()
         return super().collect(*args)
 
-    def _values():
-        if not self._resolved:
-            self.resolve()
+    def _values(self):
+        self.resolve()
         return super()._values()
 
 class VarFileLoader:
@@ -100,8 +101,8 @@ class VarFileLoader:
         return FileBackedVarFile.from_file(path)
 
     @staticmethod
-    def from_target(target):
-        return TargetBackedVarFile.from_target(target)
+    def from_module(module, outputs):
+        return ModuleBackedVarFile.from_module(module, outputs)
 
 class TempVarFile:
     def __init__(self, tfvars, keys):
@@ -119,25 +120,23 @@ class TempVarFile:
     def __exit__(self, *args):
         self._tempfile.close()
 
-class TFVars:
-    def __init__(self, varfiles):
-        self._varfiles = varfiles
-        self._var_map = None
+# Maps each variable a target consumes to the one varfile that supplies it.
+# Varfiles are only resolved once one of their variables is collected.
+class InputPlan:
+    def __init__(self, producers):
+        self._producers = producers
 
-    def _build_map(self):
-        var_map = dict()
-        for varfile in self._varfiles:
-            for key in varfile.keys:
-                var_map[key] = varfile
-        return var_map
+    @property
+    def producers(self):
+        return self._producers
 
     def _match_varfiles(self, *args):
         varfiles = defaultdict(list)
         for key in args:
-            varfiles[self._var_map.get(key)].append(key)
+            varfiles[self._producers.get(key)].append(key)
         return varfiles
 
-    def _collect(self, *args):
+    def collect(self, *args):
         varfiles = self._match_varfiles(*args)
         tfvars = {}
         for varfile, keys in varfiles.items():
@@ -146,8 +145,3 @@ class TFVars:
                 continue
             tfvars.update(varfile.collect(*keys))
         return tfvars
-
-    def collect(self, *args):
-        if self._var_map is None:
-            self._var_map = self._build_map()
-        return self._collect(*args)
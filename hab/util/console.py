@@ -0,0 +1,66 @@
+import atexit
+import sys
+import time
+from threading import Condition, Thread
+
+# How long output is gathered before it is written to the terminal
+_FLUSH_INTERVAL = 0.05
+# Pending output is written straight away once it grows this large
+_FLUSH_SIZE = 1 << 16
+
+# Multiplexes the output of every running process onto the terminal.
+# Lines are tagged with the name of the target they belong to and written
+# in batches from a single thread rather than one small write at a time.
+class Console:
+    def __init__(self, output=sys.stderr, quiet=False):
+        self._output = output
+        self.quiet = quiet
+        self._pending = []
+        self._size = 0
+        self._cond = Condition()
+        self._flusher = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(_FLUSH_INTERVAL)
+            self.flush()
+
+    def _queue(self, text):
+        with self._cond:
+            self._pending.append(text)
+            self._size += len(text)
+            if self._flusher is None:
+                self._flusher = Thread(target=self._run, name='hab-console', daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+            overflowing = self._size >= _FLUSH_SIZE
+        if overflowing:
+            self.flush()
+
+    # Output of a process, left out in quiet mode unless always is set
+    def lines(self, name, lines, always=False):
+        if self.quiet and not always:
+            return
+        prefix = f'[{name}] ' if name else ''
+        text = ''.join(f'{prefix}{l}\n' for l in lines)
+        if text:
+            self._queue(text)
+
+    # A change in what a target is doing, shown even in quiet mode.
+    # Written straight away so it stays in order with hab's own log messages.
+    def status(self, name, msg):
+        self._queue(f'[{name}] == {msg}\n')
+        self.flush()
+
+    def flush(self):
+        with self._cond:
+            pending, self._pending, self._size = self._pending, [], 0
+            if pending:
+                self._output.write(''.join(pending))
+                self._output.flush()
+
+console = Console()
+atexit.register(console.flush)
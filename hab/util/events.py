@@ -0,0 +1,46 @@
+import atexit
+import json
+import sys
+import time
+from threading import Lock
+
+# Writes one JSON object per line for every lifecycle event of a run, so tools
+# wrapping hab can follow it without scraping the console. Does nothing until
+# it is given somewhere to write to.
+class EventStream:
+    def __init__(self):
+        self._output = None
+        self._close = False
+        self._started = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self._output is not None
+
+    # `-` writes the events to stdout
+    def open(self, path):
+        if str(path) == '-':
+            self._output, self._close = sys.stdout, False
+        else:
+            self._output, self._close = open(path, 'w', buffering=1), True
+        self._started = time.monotonic()
+
+    def emit(self, event, **fields):
+        if self._output is None:
+            return
+        record = dict(event=event, time=time.time(), elapsed=round(time.monotonic() - self._started, 6), **fields)
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            # Written as it happens so consumers see each event straight away
+            self._output.write(line)
+            self._output.flush()
+
+    def close(self):
+        with self._lock:
+            if self._output is not None and self._close:
+                self._output.close()
+            self._output = None
+
+events = EventStream()
+atexit.register(events.close)
@@ -28,6 +28,9 @@ def setupLogging(
 ROOT_LOGGER = setupLogging('habitat')
 BASE_LOGGER = ROOT_LOGGER.getChild('habitat')
 
+def set_level(level):
+    ROOT_LOGGER.setLevel(level)
+
 def get_logger(root, name):
     if not '.' in name:
         return root.getChild(name)
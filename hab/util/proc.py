@@ -1,112 +1,232 @@
-from io import StringIO
-import sys
-from threading import Thread, Event
-import subprocess
+import asyncio
+import codecs
+import gzip
+import os
 import shlex
+import signal
+import sys
+from collections import deque
+from io import StringIO
+from threading import Thread, Lock, current_thread
+from .console import console
 from .log import Log
+from .trace import tracer
 
 _log = Log('proc')
 
-class TBuffer(Thread):
-    def __init__(self, stream, echo=True, output=sys.stderr):
-        super().__init__()
-        self._stream = stream
-        self._buffer = StringIO()
-        self._echo = output if echo else None
+# How long output still buffered in the pipes may take to arrive once a process has exited
+_DRAIN_TIMEOUT = 0.5
+_MAX_LINE = 1 << 16
+# Lines of both streams kept for reporting a failure when the output is captured in full
+_FAILURE_TAIL = 100
+
+# Python 3.12 and later watch children with pidfds by themselves, earlier
+# versions default to a thread blocked in waitpid for every child
+def _install_child_watcher(loop):
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, 'PidfdChildWatcher'):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        _log.debug('pidfd is unavailable, watching children with threads')
+        return
+    # The watcher is process wide, hab's loop is the only one that starts subprocesses
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.set_child_watcher(watcher)
+
+# Runs every subprocess on a single event loop in a background thread, so the
+# number of threads hab uses stays the same however many processes run at once
+class _Engine:
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = Lock()
 
     @property
-    def data(self):
-        return self._buffer.getvalue()
-
-    def run(self):
-        while True:
-            try:
-                line = self._stream.readline()
-                self._buffer.write(line)
-                if self._echo:
-                    self._echo.write(line)
-            except ValueError:
-                break
-
-    def close(self):
-        self._buffer.close()
-        self.join()
-
-    def start(self):
-        super().start()
-        return self
-
-class Process(Thread):
-    def __init__(self, cmd, echo=True, **kwargs):
-        super().__init__()
-        self._cmd = cmd
-        self._kwargs = kwargs
-        self.echo = echo
-        self._started = Event()
-        self._done = Event()
-        self._stdout = None
-        self._stderr = None
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                _install_child_watcher(self._loop)
+                self._thread = Thread(target=self._loop.run_forever, name='hab-proc', daemon=True)
+                self._thread.start()
+            return self._loop
 
     @property
-    def cwd(self):
-        return self._kwargs.get('cwd')
-
-    @cwd.setter
-    def cwd(self, value):
-        self._kwargs['cwd'] = value
+    def thread(self):
+        return self._thread
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # Calls func on the loop's thread, unless the loop was never started
+    def call(self, func):
+        with self._lock:
+            loop = self._loop
+        if loop is None:
+            return None
+        async def call():
+            return func()
+        return asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+_ENGINE = _Engine()
+
+# Collects a process's output and echoes it line by line to the console.
+# Output arrives in arbitrary chunks, so partial lines and characters are held back.
+# With a tail only that many of the last lines are kept, otherwise everything is.
+# Lines are also added to merged, where the captures of several streams can meet.
+class _Capture:
+    def __init__(self, echo=True, prefix=None, tail=None, merged=None):
+        self._buffer = StringIO() if tail is None else None
+        self._tail = deque(maxlen=tail) if tail is not None else None
+        self._merged = merged
+        self._echo = echo
+        self._prefix = prefix
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._partial = ''
 
     @property
-    def started(self):
-        return self._started.is_set()
-
-    def run(self):
-        self._started.set()
-        _log.debug(f'Starting process { self._cmd }')
-        if self.echo:
-            self._kwargs['stdout'] = self._kwargs['stderr'] = subprocess.PIPE
-            self._kwargs['encoding'] = 'utf-8'
-        self._proc = subprocess.Popen(shlex.split(self._cmd), **self._kwargs)
-        if self.echo:
-            self._stdout = TBuffer(self._proc.stdout).start()
-            self._stderr = TBuffer(self._proc.stderr).start()
-        while self._proc.poll() is None:
+    def data(self):
+        if self._buffer is not None:
+            return self._buffer.getvalue()
+        return ''.join(self._tail) + self._partial
+
+    def _write(self, text):
+        if self._buffer is not None:
+            self._buffer.write(text)
+            if not self._echo and self._merged is None:
+                return
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        # A line that never ends is passed on in pieces rather than held in memory
+        if len(self._partial) > _MAX_LINE:
+            lines.append(self._partial)
+            self._partial = ''
+        if self._tail is not None:
+            self._tail.extend(f'{l}\n' for l in lines)
+        if self._merged is not None:
+            self._merged.extend(f'{l}\n' for l in lines)
+        if self._echo:
+            console.lines(self._prefix, lines)
+
+    def feed(self, chunk):
+        self._write(self._decoder.decode(chunk))
+
+    def close(self):
+        if self._decoder is None:
+            return
+        self._write(self._decoder.decode(b'', final=True))
+        if self._echo and self._partial:
+            console.lines(self._prefix, [ self._partial ])
+        if self._tail is not None and self._partial:
+            self._tail.append(self._partial)
+        if self._merged is not None and self._partial:
+            self._merged.append(f'{self._partial}\n')
+        self._partial = ''
+        self._decoder = None
+
+# Feeds pipe output straight into the captures and reports the process's exit
+# as soon as it happens, independently of when its pipes are closed
+class _Protocol(asyncio.SubprocessProtocol):
+    def __init__(self, loop, captures, log=None):
+        self._captures = captures
+        self._log = log
+        self._open = set(captures)
+        self.exited = loop.create_future()
+        self.drained = loop.create_future()
+        if not self._open:
+            self.drained.set_result(None)
+
+    def pipe_data_received(self, fd, data):
+        if self._log is not None:
+            self._log.write(data)
+        self._captures[fd].feed(data)
+
+    def pipe_connection_lost(self, fd, exc):
+        self._captures[fd].close()
+        self._open.discard(fd)
+        if not self._open and not self.drained.done():
+            self.drained.set_result(None)
+
+    def process_exited(self):
+        self.exited.set_result(None)
+
+# Processes started in a session of their own are killed along with anything they started
+def _kill(transport, group):
+    if not group:
+        transport.kill()
+        return
+    try:
+        os.killpg(transport.get_pid(), signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def _open_log(path, cmd):
+    log = gzip.open(path, 'ab') if path.suffix == '.gz' else open(path, 'ab')
+    log.write(f'$ { cmd }\n'.encode())
+    return log
+
+# Returns the exit code, stdout and the tail of stdout and stderr interleaved as they
+# arrived, which is what to show when the command fails. stdout is captured in full
+# unless a tail is given, logfile receives all of the output either way.
+async def _run(cmd, echo=True, prefix=None, tail=None, logfile=None, **kwargs):
+    _log.debug(f'Starting process { cmd }')
+    loop = asyncio.get_running_loop()
+    captures = {}
+    # Unlike Popen, subprocess_exec pipes every stream unless told otherwise
+    kwargs.setdefault('stdin', None)
+    kwargs['stdout'] = kwargs['stderr'] = asyncio.subprocess.PIPE if echo else None
+    merged = deque(maxlen=tail if tail is not None else _FAILURE_TAIL)
+    if echo:
+        captures = { 1: _Capture(prefix=prefix, tail=tail, merged=merged), 2: _Capture(prefix=prefix, tail=0, merged=merged) }
+    log = _open_log(logfile, cmd) if logfile is not None and echo else None
+    try:
+        transport, protocol = await loop.subprocess_exec(lambda: _Protocol(loop, captures, log), *shlex.split(cmd), **kwargs)
+        try:
+            await asyncio.shield(protocol.exited)
+            # Background processes the command left behind may hold its pipes open forever
             try:
-                self._proc.wait(timeout=1)
-            except subprocess.TimeoutExpired:
-                pass
-        self._done.set()
-        _log.debug(f'Command { self._cmd } exited { self._proc.poll() }')
-
-    def wait(self):
-        if not self.started:
-            self.start()
-        self._done.wait()
-        return self._proc.poll()
-
-    def stdout(self):
-        if not self.started:
-            self.start()
-            self.wait()
-        if self._stdout is not None:
-            return self._stdout.data
-
-    def stderr(self):
-        if not self.started:
-            self.start()
-            self.wait()
-        if self._stderr is not None:
-            return self._stderr.data
-
-    def join(self):
-        if self.echo:
-            self._stdout.close()
-            self._stderr.close()
-        super().join()
-
-def run(*args, **kwargs):
-    proc = Process(*args, **kwargs)
-    proc.start()
-    retcode = proc.wait()
-    stdout = proc.stdout()
-    proc.join()
-    return retcode, stdout
+                await asyncio.wait_for(asyncio.shield(protocol.drained), _DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                _log.debug(f'Output of { cmd } is still open after it exited, closing it')
+            retcode = transport.get_returncode()
+        except asyncio.CancelledError:
+            _log.debug(f'Killing { cmd }, it is no longer needed')
+            _kill(transport, kwargs.get('start_new_session', False))
+            # Closing the transport before the exit is reported would reap the process behind the child watcher's back
+            await protocol.exited
+            raise
+        finally:
+            transport.close()
+    finally:
+        if log is not None:
+            log.close()
+    for capture in captures.values():
+        capture.close()
+    # Keeps the process's output ahead of anything logged about it
+    console.flush()
+    _log.debug(f'Command { cmd } exited { retcode }')
+    if not echo:
+        return retcode, None, None
+    return retcode, captures[1].data, ''.join(merged)
+
+# For coroutines already running on hab's loop, see wait_for.
+# Cancelling it kills the process.
+async def run_async(cmd, *args, **kwargs):
+    return await _run(cmd, *args, **kwargs)
+
+# Runs a coroutine on hab's loop and blocks until it's done
+def wait_for(coro):
+    return _ENGINE.run(coro)
+
+# For what has to happen on the thread of hab's loop itself
+def on_loop_thread():
+    return _ENGINE.thread is current_thread()
+
+def call_on_loop(func):
+    return _ENGINE.call(func)
+
+def run(cmd, *args, **kwargs):
+    with tracer.span('process', 'subprocess', cmd=cmd):
+        return _ENGINE.run(_run(cmd, *args, **kwargs))
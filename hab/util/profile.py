@@ -0,0 +1,107 @@
+import cProfile
+import io
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from . import proc
+from .console import console
+
+# Built-in functions a thread blocks in while it waits rather than works
+_BLOCKING = re.compile(r'\b(acquire|sleep|poll|select|wait|waitpid)\b')
+
+def _is_blocking(func):
+    filename, _, name = func
+    return filename == '~' and _BLOCKING.search(name) is not None
+
+def _pstats_key(func):
+    code = func.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+# What threads run subprocesses and waiters through, and block in until they're done.
+# run_async and the waiters' probes only run inside wait_for, so counting it covers them.
+_WAITING = { _pstats_key(proc.run), _pstats_key(proc.wait_for) }
+
+# Profiles every thread hab runs. Before Python 3.12 a profiler only sees the
+# thread that enabled it, so each new thread gets its own and they are merged.
+# A profiler can only be stopped from its own thread as well.
+class Profiler:
+    def __init__(self):
+        self._profiles = []
+        self._running = {}
+        self._lock = threading.Lock()
+        self._started = None
+        self._duration = None
+
+    def _start(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+            self._running[threading.get_ident()] = profile
+        profile.enable()
+
+    def _stop(self):
+        with self._lock:
+            profile = self._running.pop(threading.get_ident(), None)
+        if profile is not None:
+            profile.disable()
+
+    def _start_thread(self, *args):
+        # Daemon threads besides hab's loop outlive the run with nothing that could
+        # stop a profiler from inside them, so they aren't profiled
+        if threading.current_thread().daemon and not proc.on_loop_thread():
+            sys.setprofile(None)
+            return
+        # Replaces itself with the thread's own profiler on the thread's first call
+        self._start()
+
+    def start(self):
+        self._started = time.monotonic()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        self._start()
+
+    def stop(self):
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+            # Workers have exited by now, which ended their profilers, but the loop keeps running
+            proc.call_on_loop(self._stop)
+        self._stop()
+        self._duration = time.monotonic() - self._started
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    # Splits the time summed over all threads into time spent running hab's code
+    # and time spent waiting, on subprocesses and waiters in particular. Threads run at the
+    # same time, so either can exceed the wall time.
+    def summarize(self, stats, top):
+        running = sum(tt for func, (_, _, tt, _, _) in stats.stats.items() if not _is_blocking(func))
+        waiting = sum(ct for func, (_, _, _, ct, _) in stats.stats.items() if func in _WAITING)
+        out = io.StringIO()
+        out.write(f'Wall time {self._duration:.2f}s, summed over threads: running hab code {running:.2f}s, waiting on subprocesses and waiters {waiting:.2f}s\n')
+        stats.stream = out
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+        return out.getvalue()
+
+# Profiles the body and writes the stats to path, which `python -m pstats` can read
+@contextmanager
+def profiled(path, top=25):
+    if path is None:
+        yield
+        return
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        stats = profiler.stop()
+        stats.dump_stats(path)
+        console.flush()
+        sys.stderr.write(profiler.summarize(stats, top))
+        sys.stderr.write(f'Profile written to {path}\n')
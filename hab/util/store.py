@@ -0,0 +1,59 @@
+import json
+import os
+from threading import Lock
+from .log import Log
+
+_log = Log('store')
+
+# A dictionary kept in a JSON file between runs. It is read the first time it
+# is used, and written to a temporary file that replaces the old one, so an
+# interrupted run never leaves half a file behind. Subclasses hold _lock
+# around anything touching _data.
+class JSONStore:
+    # What the file holds, for warnings about it
+    _description = 'cache'
+    # Permissions the file is created with, before the umask
+    _mode = 0o666
+
+    def __init__(self, path):
+        self._path = path
+        self._contents = None
+        self._dirty = False
+        self._lock = Lock()
+
+    # Converts between the file's contents and _data, for stores that wrap or version it
+    def _decode(self, data):
+        return data
+
+    def _encode(self, data):
+        return data
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                return self._decode(json.load(f))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _log.warning(f'Ignoring unreadable {self._description} at {self._path}: {e}')
+            return {}
+
+    def _save(self):
+        tmp = self._path.with_suffix('.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, self._mode)
+        with open(fd, 'w') as f:
+            json.dump(self._encode(self._data), f)
+        os.replace(tmp, self._path)
+        self._dirty = False
+
+    @property
+    def _data(self):
+        if self._contents is None:
+            self._contents = self._load()
+        return self._contents
+
+    # Writes out the changes stores that don't save as they go have made
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
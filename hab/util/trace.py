@@ -0,0 +1,101 @@
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from .log import Log
+
+_log = Log('trace')
+
+# Records where the time of a run goes as a Chrome trace-event file, which
+# Perfetto and chrome://tracing can open. Spans are kept in memory and
+# written out once at the end, nothing is recorded until a file is given.
+class Tracer:
+    def __init__(self):
+        self._path = None
+        self._started = None
+        self._events = []
+        self._threads = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._path is not None
+
+    def open(self, path):
+        self._path = path
+        self._started = time.perf_counter_ns()
+
+    def _now(self):
+        return (time.perf_counter_ns() - self._started) / 1000
+
+    def _record(self, event):
+        thread = threading.current_thread()
+        event.update(pid=os.getpid(), tid=thread.ident)
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            self._events.append(event)
+
+    @contextmanager
+    def _span(self, name, cat, args):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._record(dict(name=name, cat=cat, ph='X', ts=start, dur=self._now() - start, args=args))
+
+    # Spans on the same thread must nest, which they do as long as they're used as context managers
+    def span(self, name, cat='hab', **args):
+        if self._path is None:
+            return nullcontext()
+        return self._span(name, cat, args)
+
+    @contextmanager
+    def _async_span(self, name, cat, args):
+        span_id = next(self._ids)
+        self._record(dict(name=name, cat=cat, ph='b', id=span_id, ts=self._now(), args=args))
+        try:
+            yield
+        finally:
+            self._record(dict(name=name, cat=cat, ph='e', id=span_id, ts=self._now()))
+
+    # Spans that may overlap others on the same thread, like coroutines, each get a track of their own
+    def async_span(self, name, cat='hab', **args):
+        if self._path is None:
+            return nullcontext()
+        return self._async_span(name, cat, args)
+
+    def counter(self, name, **values):
+        if self._path is not None:
+            self._record(dict(name=name, ph='C', ts=self._now(), args=values))
+
+    def save(self):
+        if self._path is None:
+            return
+        with self._lock:
+            events = [
+                dict(name='thread_name', ph='M', pid=os.getpid(), tid=tid, args=dict(name=name))
+                for tid, name in self._threads.items()
+            ]
+            events.extend(self._events)
+        with open(self._path, 'w') as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+        _log.info(f'Wrote trace of {len(events)} events to {self._path}')
+        self._path = None
+
+tracer = Tracer()
+atexit.register(tracer.save)
+
+# Records every call of the decorated function as a span
+def traced(name, cat='hab'):
+    def outer(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with tracer.span(name, cat):
+                return func(*args, **kwargs)
+        return inner
+    return outer
@@ -0,0 +1,98 @@
+import re
+import pytest
+from hab import hcl
+from hab.error import HCLSyntaxError
+
+def _attribute(text, name='x'):
+    return next(a for a in hcl.parse(text) if isinstance(a, hcl.Attribute) and a.name == name)
+
+@pytest.mark.parametrize('text, value', [
+    ('x = "plain"', 'plain'),
+    ('x = ""', ''),
+    ('x = "tab\\tquote\\" backslash\\\\"', 'tab\tquote" backslash\\'),
+    ('x = "\\u00e9"', 'é'),
+    ('x = "cost $5 or 5%"', 'cost $5 or 5%'),
+    ('x = "a$${b}"', 'a${b}'),
+    ('x = "a%%{b}"', 'a%{b}'),
+    ('x = 42', 42),
+    ('x = -1.5e2', -150.0),
+    ('x = true', True),
+    ('x = null', None),
+    ('x = [1, "two", [3]]', [1, 'two', [3]]),
+    ('x = { a = 1, "b" = [true], c: "d" }', { 'a': 1, 'b': [True], 'c': 'd' }),
+    ('x = {\n  a = 1\n  b = 2\n}', { 'a': 1, 'b': 2 }),
+    ('x = <<EOT\nline one\n  line two\nEOT\n', 'line one\n  line two\n'),
+    ('x = <<-EOT\n    one\n      two\n    EOT\n', 'one\n  two\n'),
+    ('x = "a" # comment', 'a'),
+    ('x = "a" // comment', 'a'),
+    ('x = /* inline */ "a"', 'a'),
+])
+def test_literals(text, value):
+    assert _attribute(text).value == value
+
+# Anything hab can't evaluate is kept as its source text
+@pytest.mark.parametrize('text, expr', [
+    ('x = "a${b}"', '"a${b}"'),
+    ('x = "$${a} ${b}"', '"$${a} ${b}"'),
+    ('x = "${ { a = "}" }.a }"', '"${ { a = "}" }.a }"'),
+    ('x = var.y', 'var.y'),
+    ('x = upper("a")', 'upper("a")'),
+    ('x = [\n  var.a,\n  var.b,\n]', '[\n  var.a,\n  var.b,\n]'),
+])
+def test_expressions(text, expr):
+    attribute = _attribute(text)
+    assert attribute.literal() is None
+    assert attribute.expr == expr
+
+def test_blocks():
+    text = '''
+# leading comment
+terraform {
+  required_providers {
+    aws = { source = "hashicorp/aws" }
+  }
+  backend "s3" {
+    bucket = "b" // trailing comment
+  }
+}
+/* a comment
+   over lines */
+resource "aws_instance" "web" {
+  tags = { Name = "${var.name}-x" }
+  user_data = <<-EOT
+    } not a brace {
+  EOT
+}
+variable "v" {}
+'''
+    items = list(hcl.parse(text))
+    assert [ (b.type, b.labels) for b in items ] == [
+        ('terraform', ()),
+        ('resource', ('aws_instance', 'web')),
+        ('variable', ('v',)),
+    ]
+    terraform = items[0].body
+    assert [ b.type for b in terraform.blocks ] == [ 'required_providers', 'backend' ]
+    assert terraform.blocks_of('required_providers')[0].body.attributes['aws'].value == { 'source': 'hashicorp/aws' }
+    assert terraform.blocks_of('backend')[0].labels == ('s3',)
+    assert terraform.blocks_of('backend')[0].body.attributes['bucket'].value == 'b'
+    assert items[1].body.attributes['user_data'].value == '} not a brace {\n'
+
+def test_block_types_filter():
+    text = 'resource "a" "b" {\n  x = "}"\n}\nvariable "v" {\n  default = 1\n}\noutput "o" {\n  value = 1\n}\n'
+    assert [ b.labels for b in hcl.parse(text, block_types=('variable',)) ] == [ ('v',) ]
+
+@pytest.mark.parametrize('text, error', [
+    ('x = "a\n', 'unterminated string on line 1'),
+    ('x = "${a"\n', 'unterminated string on line 1'),
+    ('x = [1, 2\n', 'incomplete expression for x'),
+    ('x = (1))\n', "unbalanced ')' on line 1"),
+    ('x =\n', 'incomplete expression for x'),
+    ('= 1\n', "unexpected '=' on line 1"),
+    ('x = 1\n@\n', "unexpected character '@' on line 2"),
+    ('variable "v" {\n', 'unterminated block on line 1'),
+    ('x = <<EOT\nnever ends\n', 'unterminated heredoc on line 1'),
+])
+def test_malformed(text, error):
+    with pytest.raises(HCLSyntaxError, match=re.escape(error)):
+        list(hcl.parse(text))
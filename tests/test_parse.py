@@ -0,0 +1,45 @@
+from hab.parse import (
+    Backend, ModuleCall, ProviderRequirement,
+    parse_tf_backends, parse_tf_init_config, parse_tf_module_calls, parse_tf_required_providers, parse_tfvars,
+)
+
+MAIN_TF = '''
+terraform {
+  required_providers {
+    aws = { source = "hashicorp/aws", version = "~> 5.0" }
+    null = "~> 3.0"
+  }
+  backend "s3" {
+    bucket = "b"
+  }
+}
+provider "google" {
+  version = "4.0"
+}
+module "vpc" {
+  source = "./vpc"
+}
+resource "aws_instance" "web" {}
+broken = "
+'''
+
+def test_init_config():
+    providers, calls, backends = parse_tf_init_config(MAIN_TF)
+    assert providers == [
+        ProviderRequirement('aws', 'hashicorp/aws', '~> 5.0'),
+        ProviderRequirement('null', None, '~> 3.0'),
+        ProviderRequirement('google', None, '4.0'),
+    ]
+    assert calls == [ ModuleCall('vpc', '"./vpc"', None) ]
+    assert backends == [ Backend('s3', '\n    bucket = "b"\n  ') ]
+
+def test_init_config_matches_separate_parses():
+    assert parse_tf_init_config(MAIN_TF) == (
+        parse_tf_required_providers(MAIN_TF),
+        parse_tf_module_calls(MAIN_TF),
+        parse_tf_backends(MAIN_TF),
+    )
+
+def test_tfvars():
+    variables = parse_tfvars('a = "x"\nb = [1, 2]\nc = "a$${b}"\nd = var.e\n')
+    assert { v.name: v.value for v in variables } == { 'a': 'x', 'b': [1, 2], 'c': 'a${b}', 'd': 'var.e' }
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from hab.env import probes
+from hab.env.waiter import NativeWaiter
+from hab.error import ProbeFailedError
+
+# Serves a canned response to every connection on a local port
+async def _serve(response):
+    async def handle(reader, writer):
+        await reader.readuntil(b'\r\n\r\n')
+        writer.write(response)
+        await writer.drain()
+        writer.close()
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+def _http(response, **params):
+    async def run():
+        server, port = await _serve(response)
+        async with server:
+            return await probes.http(f'http://127.0.0.1:{port}/ready', **params)
+    return asyncio.run(run())
+
+def _unused_port():
+    async def run():
+        server = await asyncio.start_server(lambda r, w: None, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        return port
+    return asyncio.run(run())
+
+def test_tcp_connects():
+    async def run():
+        server, port = await _serve(b'')
+        async with server:
+            await probes.tcp('127.0.0.1', str(port))
+    asyncio.run(run())
+
+def test_tcp_refused():
+    with pytest.raises(OSError):
+        asyncio.run(probes.tcp('127.0.0.1', _unused_port()))
+
+def test_tcp_invalid_host():
+    with pytest.raises(ProbeFailedError):
+        asyncio.run(probes.tcp('x' * 64 + '.example', 80))
+
+def test_http_ok_with_match():
+    _http(b'HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\nready ok', match=r'ok$')
+
+def test_http_match_with_braces():
+    _http(b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\nok200!', match=r'ok\d{3}')
+
+def test_http_no_match():
+    with pytest.raises(ProbeFailedError):
+        _http(b'HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\nstarting', match='ready')
+
+def test_http_chunked():
+    _http(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n', match='hello world')
+
+def test_http_bad_chunk_size():
+    with pytest.raises(ProbeFailedError):
+        _http(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\nhello\r\n0\r\n\r\n', match='hello')
+
+def test_http_truncated_body():
+    with pytest.raises(ProbeFailedError):
+        _http(b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nhello', match='hello')
+
+def test_http_redirect_passes_by_default():
+    _http(b'HTTP/1.1 302 Found\r\nLocation: /elsewhere\r\nContent-Length: 0\r\n\r\n')
+
+def test_http_status():
+    _http(b'HTTP/1.1 204 No Content\r\n\r\n', status=[200, 204])
+    with pytest.raises(ProbeFailedError):
+        _http(b'HTTP/1.1 302 Found\r\nContent-Length: 0\r\n\r\n', status=200)
+
+def test_http_server_error():
+    with pytest.raises(ProbeFailedError):
+        _http(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n')
+
+def test_http_not_http():
+    with pytest.raises(ProbeFailedError):
+        _http(b'SSH-2.0-OpenSSH\r\n\r\n')
+
+def test_file(tmp_path):
+    path = tmp_path / 'ready'
+    with pytest.raises(ProbeFailedError):
+        asyncio.run(probes.file(str(path)))
+    path.write_text('state: starting\n')
+    asyncio.run(probes.file(str(path)))
+    with pytest.raises(ProbeFailedError):
+        asyncio.run(probes.file(str(path), match='state: ready'))
+    path.write_text('state: ready\n')
+    asyncio.run(probes.file(str(path), match='state: ready'))
+
+# A probe that fails for whatever reason is an attempt to retry, not an error
+def test_waiter_retries_truncated_response():
+    async def run():
+        server, port = await _serve(b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nhello')
+        async with server:
+            waiter = NativeWaiter('http', { 'url': 'http://127.0.0.1:{port}/', 'match': 'hello' }, timeout=0.3, interval=0.05)
+            return await waiter.wait({ 'port': port })
+    success, attempts = asyncio.run(run())
+    assert not success
+    assert attempts > 1
+
+def test_waiter_waits_for_file(tmp_path):
+    path = tmp_path / 'ready-web'
+    async def run():
+        waiter = NativeWaiter('file', { 'path': str(tmp_path / 'ready-{host}') }, timeout=5, interval=0.05)
+        asyncio.get_running_loop().call_later(0.2, path.write_text, 'yes')
+        return await waiter.wait({ 'host': 'web' })
+    success, attempts = asyncio.run(run())
+    assert success
+    assert attempts > 1
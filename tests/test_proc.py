@@ -0,0 +1,27 @@
+from hab.util import proc
+
+def test_run_captures_stdout():
+    retcode, stdout, output = proc.run("sh -c 'echo one; echo two'", tail=100)
+    assert retcode == 0
+    assert stdout == 'one\ntwo\n'
+    assert output == 'one\ntwo\n'
+
+# What a failure reports has to include stderr, where terraform writes its errors
+def test_run_keeps_stderr_in_output():
+    retcode, stdout, output = proc.run("sh -c 'echo progress; sleep 0.05; echo Error: boom >&2; exit 1'", tail=100)
+    assert retcode == 1
+    assert stdout == 'progress\n'
+    assert output == 'progress\nError: boom\n'
+
+def test_run_output_is_a_tail():
+    _, stdout, output = proc.run("sh -c 'for i in 1 2 3 4 5; do echo $i; done; echo oops >&2'", tail=3)
+    assert stdout == '3\n4\n5\n'
+    assert output == '4\n5\noops\n'
+
+def test_run_captures_everything_without_a_tail():
+    _, stdout, output = proc.run("sh -c 'echo done; printf partial >&2'")
+    assert stdout == 'done\n'
+    assert output == 'done\npartial\n'
+
+def test_run_without_echo():
+    assert proc.run("sh -c 'exit 3'", echo=False) == (3, None, None)
@@ -0,0 +1,32 @@
+import os
+from hab.outputs import OutputStore
+from hab.stage.timings import TimingStore
+from hab.util.store import JSONStore
+
+def test_round_trip(tmp_path):
+    store = JSONStore(tmp_path / 'store.json')
+    store._data['a'] = 1
+    store._dirty = True
+    store.save()
+    assert JSONStore(tmp_path / 'store.json')._data == { 'a': 1 }
+    assert not (tmp_path / 'store.tmp').exists()
+
+def test_unreadable_file_is_ignored(tmp_path):
+    (tmp_path / 'store.json').write_text('{ not json')
+    assert JSONStore(tmp_path / 'store.json')._data == {}
+
+def test_output_cache_is_private(tmp_path):
+    store = OutputStore(tmp_path / 'outputs.json')
+    with store._lock:
+        store._save()
+    assert os.stat(tmp_path / 'outputs.json').st_mode & 0o077 == 0
+
+# Timings are recorded after every phase but only written once the run is over
+def test_timings_are_saved_once(tmp_path):
+    path = tmp_path / 'timings.json'
+    timings = TimingStore(path)
+    timings.record('a', 'plan', 2.0)
+    timings.record('a', 'plan', 4.0)
+    assert not path.exists()
+    timings.save()
+    assert TimingStore(path).estimate('a', 'plan') == 3.0
@@ -0,0 +1,168 @@
+import asyncio
+import time
+import pytest
+from hab.env import waiter as waiter_module
+from hab.env.waiter import BaseWaiter, NativeWaiter, WaiterFlights, wait_all
+
+# Runs a check given as a coroutine function of the attempt number
+class _Waiter(BaseWaiter):
+    def __init__(self, check, attempt_timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self._check_attempt = check
+        self._attempt_timeout = attempt_timeout
+        self.attempts = 0
+
+    @property
+    def name(self):
+        return 'test'
+
+    def _templates(self):
+        return []
+
+    def key(self, args):
+        return ('test', id(self))
+
+    async def _check(self, args, prefix):
+        self.attempts += 1
+        return await self._check_attempt(self.attempts)
+
+async def _fail(attempt):
+    return False
+
+async def _hang(attempt):
+    await asyncio.sleep(60)
+
+def _waiter(path, **kwargs):
+    return NativeWaiter('file', { 'path': path }, interval=0.05, **kwargs)
+
+def test_flights_share_identical_waits(tmp_path):
+    path = tmp_path / 'ready'
+    async def run():
+        flights = WaiterFlights()
+        asyncio.get_running_loop().call_later(0.2, path.write_text, 'yes')
+        return await asyncio.gather(
+            flights.wait(_waiter(str(path), timeout=5), {}),
+            flights.wait(_waiter(str(path), timeout=5), {}),
+        )
+    (first, first_attempts), (second, second_attempts) = asyncio.run(run())
+    assert first and second
+    assert first_attempts == second_attempts
+
+# A target with a shorter deadline must not be held to a longer one, nor the other way around
+def test_flights_keep_their_own_deadlines(tmp_path):
+    path = str(tmp_path / 'never')
+    async def run():
+        flights = WaiterFlights()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async def timed(waiter):
+            success, _ = await flights.wait(waiter, {})
+            return success, loop.time() - started
+        return await asyncio.gather(timed(_waiter(path, timeout=0.2)), timed(_waiter(path, timeout=0.6)))
+    (short, short_took), (long, long_took) = asyncio.run(run())
+    assert not short and not long
+    assert short_took < 0.5
+    assert long_took >= 0.6
+
+# A target that joins just after the only other one gave up starts a wait of its own
+# rather than inheriting the cancellation
+def test_flights_join_after_cancel(tmp_path):
+    path = tmp_path / 'ready'
+    async def run():
+        flights = WaiterFlights()
+        first = asyncio.ensure_future(flights.wait(_waiter(str(path), timeout=5), {}))
+        await asyncio.sleep(0.1)
+        first.cancel()
+        # Lets the first target hand its cancellation on to the shared wait
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flights.wait(_waiter(str(path), timeout=5), {}))
+        path.write_text('yes')
+        return await asyncio.gather(first, second, return_exceptions=True)
+    first, second = asyncio.run(run())
+    assert isinstance(first, asyncio.CancelledError)
+    assert second[0]
+
+def _probe(result, delay, log):
+    async def probe():
+        log.append(f'started {result}')
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f'cancelled {result}')
+            raise
+        log.append(f'finished {result}')
+        return result
+    return probe
+
+def test_wait_all_in_order_stops_at_first_failure():
+    log = []
+    assert not asyncio.run(wait_all([ _probe(True, 0, log), _probe(False, 0, log), _probe(True, 0, log) ]))
+    assert log == [ 'started True', 'finished True', 'started False', 'finished False' ]
+
+def test_wait_all_in_parallel_cancels_the_rest():
+    log = []
+    started = time.monotonic()
+    assert not asyncio.run(wait_all([ _probe(True, 5, log), _probe(False, 0.05, log) ], parallel=True))
+    assert time.monotonic() - started < 1
+    assert 'cancelled True' in log
+    assert 'finished True' not in log
+
+def test_wait_all_in_parallel_succeeds():
+    log = []
+    assert asyncio.run(wait_all([ _probe(True, 0.05, log), _probe(True, 0, log) ], parallel=True))
+
+def test_without_timeout_runs_once():
+    waiter = _Waiter(_fail)
+    assert asyncio.run(waiter.wait({})) == (False, 1)
+
+def test_retries_until_success():
+    async def third(attempt):
+        return attempt == 3
+    waiter = _Waiter(third, timeout=5, interval=0.01)
+    assert asyncio.run(waiter.wait({})) == (True, 3)
+
+# Each delay is drawn from zero up to an interval that doubles after every failure, up to the maximum
+def test_full_jitter_backoff(monkeypatch):
+    bounds = []
+    def uniform(low, high):
+        bounds.append((low, high))
+        return 0
+    monkeypatch.setattr(waiter_module.random, 'uniform', uniform)
+    async def sixth(attempt):
+        return attempt == 6
+    waiter = _Waiter(sixth, timeout=60, interval=1, max_interval=5)
+    assert asyncio.run(waiter.wait({})) == (True, 6)
+    assert bounds == [ (0, 1), (0, 2), (0, 4), (0, 5), (0, 5) ]
+
+def test_backoff_delay_stops_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(waiter_module.random, 'uniform', lambda low, high: high)
+    waiter = _Waiter(_fail, timeout=0.2, interval=10)
+    started = time.monotonic()
+    success, attempts = asyncio.run(waiter.wait({}))
+    assert not success
+    assert attempts == 2
+    assert time.monotonic() - started < 1
+
+def test_overall_deadline_cuts_an_attempt_short():
+    waiter = _Waiter(_hang, timeout=0.2)
+    started = time.monotonic()
+    assert asyncio.run(waiter.wait({})) == (False, 1)
+    assert 0.2 <= time.monotonic() - started < 1
+
+def test_attempt_timeout_retries_hung_attempts():
+    waiter = _Waiter(_hang, attempt_timeout=0.05, timeout=0.5, interval=0.01, max_interval=0.01)
+    started = time.monotonic()
+    success, attempts = asyncio.run(waiter.wait({}))
+    assert not success
+    assert attempts > 3
+    assert time.monotonic() - started < 1.5
+
+def test_attempt_timeout_applies_without_overall_timeout():
+    waiter = _Waiter(_hang, attempt_timeout=0.05)
+    assert asyncio.run(waiter.wait({})) == (False, 1)
+
+def test_waiter_needs_a_check():
+    class Incomplete(BaseWaiter):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()